@@ -1,29 +1,233 @@
 import psycopg2
 import logging
+import threading
+import time
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
 from flask import current_app, g
 
+# Incremented every time schema.sql is applied, used to invalidate cached table metadata
+_schema_version = 0
+
 def setLogger(logger: logging.Logger):
     global my_logger 
     my_logger = logger
 
-def get_db():    
-    connection = psycopg2.connect(current_app.config['DATABASE'])
-    my_logger.debug("db connection established!")
-    return connection
+
+class PoolTimeoutError(Exception):
+    pass
+
+
+###################################################################################
+# ConnectionPool
+###################################################################################
+class ConnectionPool:
+    """Thread-safe pool of psycopg2 connections.
+    Connections are kept open between requests. A checkout waits up to timeout seconds when all max_size
+    connections are in use. Connections idle for longer than health_check_interval seconds are tested before reuse.
+    """
+
+    def __init__(self, dsn, min_size=1, max_size=10, timeout=10.0, health_check_interval=30.0):
+        self._dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+
+        # idle connections as (connection, time returned to the pool)
+        self._idle = []
+        self._in_use = set()
+        # number of connections being opened outside the lock
+        self._connecting = 0
+        self._condition = threading.Condition()
+        self._closed = False
+
+        # statistics
+        self._checkouts = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._discarded = 0
+        self._total_checkout_latency = 0.0
+        self._max_checkout_latency = 0.0
+
+        for _ in range(min_size):
+            self._idle.append((self._connect(), time.monotonic()))
+
+    def _connect(self):
+        connection = psycopg2.connect(self._dsn)
+        my_logger.debug("db connection established!")
+        return connection
+
+    def _is_healthy(self, connection, idle_since) -> bool:
+        if connection.closed:
+            return False
+        if time.monotonic() - idle_since < self.health_check_interval:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1;")
+            connection.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, connection):
+        self._discarded += 1
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+
+    def getconn(self):
+        """Checks out a connection, waiting up to timeout seconds if the pool is exhausted"""
+        start = time.perf_counter()
+        deadline = time.monotonic() + self.timeout
+        waited = False
+
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise PoolError("connection pool is closed")
+
+                if self._idle:
+                    connection, idle_since = self._idle.pop()
+                    break
+
+                if len(self._in_use) + self._connecting < self.max_size:
+                    connection, idle_since = None, None
+                    # reserve the slot while connecting outside the lock
+                    self._connecting += 1
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeoutError(f"No database connection available after {self.timeout} s "
+                                           f"({self.max_size} in use)")
+                waited = True
+                self._condition.wait(remaining)
+
+            if waited:
+                self._waits += 1
+
+        if connection is None:
+            try:
+                connection = self._connect()
+            finally:
+                with self._condition:
+                    self._connecting -= 1
+                    self._condition.notify()
+        elif not self._is_healthy(connection, idle_since):
+            my_logger.warning("Discarding broken db connection")
+            self._discard(connection)
+            connection = self._connect()
+
+        latency = time.perf_counter() - start
+        with self._condition:
+            self._in_use.add(connection)
+            self._checkouts += 1
+            self._total_checkout_latency += latency
+            self._max_checkout_latency = max(self._max_checkout_latency, latency)
+        return connection
+
+    def putconn(self, connection):
+        """Returns a connection to the pool. Open transactions are rolled back"""
+        with self._condition:
+            # ignore connections that are not checked out (e.g. returned twice)
+            if connection not in self._in_use:
+                return
+
+        broken = connection.closed
+        if not broken and connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                connection.rollback()
+            except psycopg2.Error:
+                broken = True
+
+        with self._condition:
+            self._in_use.discard(connection)
+            if broken or self._closed:
+                self._discard(connection)
+            else:
+                self._idle.append((connection, time.monotonic()))
+            self._condition.notify()
+
+    def closeall(self):
+        with self._condition:
+            self._closed = True
+            for connection, _ in self._idle:
+                self._discard(connection)
+            self._idle = []
+            self._condition.notify_all()
+
+    @property
+    def stats(self) -> dict:
+        with self._condition:
+            in_use = len(self._in_use)
+            idle = len(self._idle)
+        average_latency = self._total_checkout_latency / self._checkouts if self._checkouts else 0.0
+        return {'in_use': in_use,
+                'idle': idle,
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'timeouts': self._timeouts,
+                'discarded': self._discarded,
+                'avg_checkout_latency_ms': average_latency * 1000.0,
+                'max_checkout_latency_ms': self._max_checkout_latency * 1000.0}
+
+
+def _get_pool(app=None) -> ConnectionPool:
+    app = app if app else current_app
+    if 'db_pool' not in app.extensions:
+        app.extensions['db_pool'] = ConnectionPool(app.config['DATABASE'],
+                                                   min_size=app.config.get('DB_POOL_MIN_SIZE', 1),
+                                                   max_size=app.config.get('DB_POOL_MAX_SIZE', 10),
+                                                   timeout=app.config.get('DB_POOL_TIMEOUT', 10.0),
+                                                   health_check_interval=app.config.get('DB_POOL_HEALTH_CHECK_INTERVAL', 30.0))
+    return app.extensions['db_pool']
+
+def get_db():
+    """Returns the pooled connection of the current app context, checking one out on first use"""
+    if 'db' not in g:
+        g.db = _get_pool().getconn()
+    return g.db
 
 def close_db(connection):
+    """Returns the connection to the pool"""
     if connection:
-        connection.close()
+        if g.get('db') is connection:
+            g.pop('db')
+        _get_pool().putconn(connection)
+
+def teardown_db(exception=None):
+    """Returns a connection that was not closed by the request to the pool"""
+    connection = g.pop('db', None)
+    if connection is not None:
+        _get_pool().putconn(connection)
+
+def get_schema_version() -> int:
+    return _schema_version
+
+def get_pool_stats() -> dict:
+    return _get_pool().stats
 
 def init_db(app):
+    global _schema_version
+    _get_pool(app)
+    app.teardown_appcontext(teardown_db)
+
     with app.app_context():
-        
+
         connection = get_db()
         cursor = connection.cursor()
-        
+
         with current_app.open_resource('../DB/schema.sql', mode='r') as f:
             cursor.execute(f.read())
 
         cursor.close()
         connection.commit()
-        my_logger.debug("db is initialised!")     
\ No newline at end of file
+        close_db(connection)
+        _schema_version += 1
+        my_logger.debug("db is initialised!")
@@ -87,6 +87,19 @@ CREATE TABLE IF NOT EXISTS visa (
 	CONSTRAINT tcpip_port_specified CHECK ((NOT tcpip_specify_port) OR (tcpip_port IS NOT NULL))
 );
 
+-- Columns added after the first release, existing databases get them with their default value
+-- coalesce_commands: buffered set commands may be joined into one semicolon separated message
+ALTER TABLE visa ADD COLUMN IF NOT EXISTS coalesce_commands BOOLEAN DEFAULT true;
+-- max_message_length: maximum length of a joined message, including the termination character(s)
+ALTER TABLE visa ADD COLUMN IF NOT EXISTS max_message_length INTEGER DEFAULT 256;
+-- suppress_redundant_writes: a set command is skipped when the value equals the last value confirmed by the instrument
+ALTER TABLE visa ADD COLUMN IF NOT EXISTS suppress_redundant_writes BOOLEAN DEFAULT true;
+-- list_arm_cmd, list_trigger_cmd: hardware list mode, the armed instrument steps to the next point on every trigger
+ALTER TABLE visa ADD COLUMN IF NOT EXISTS list_arm_cmd TEXT;
+ALTER TABLE visa ADD COLUMN IF NOT EXISTS list_trigger_cmd TEXT;
+-- list_max_points: maximum number of points of a list, NULL if the driver does not declare a limit
+ALTER TABLE visa ADD COLUMN IF NOT EXISTS list_max_points INTEGER;
+
 -- custom types used for quantities table
 DO $$ BEGIN
     CREATE TYPE datatype AS ENUM ('DOUBLE', 'BOOLEAN', 'COMBO', 'STRING', 'COMPLEX',
@@ -141,5 +154,17 @@ CREATE TABLE IF NOT EXISTS quantities (
 	PRIMARY KEY (cute_name, label)
 );
 
+-- Columns added after the first release
+-- vector_dtype: NumPy dtype (with byte order) of the binary block sent for VECTOR and VECTOR_COMPLEX quantities
+ALTER TABLE quantities ADD COLUMN IF NOT EXISTS vector_dtype TEXT;
+-- suppress_redundant_writes: overrides the setting of the visa table, NULL inherits it
+ALTER TABLE quantities ADD COLUMN IF NOT EXISTS suppress_redundant_writes BOOLEAN;
+-- list_cmd: uploads the points of a sweep for hardware list mode, <*> is replaced by the comma separated values
+ALTER TABLE quantities ADD COLUMN IF NOT EXISTS list_cmd TEXT;
+-- position: index of the quantity in the driver, quantities are read back in this order.
+--           It is NULL for instruments added before the column existed, those come last sorted by label
+--           until the instrument is added again
+ALTER TABLE quantities ADD COLUMN IF NOT EXISTS position INTEGER;
+
 -- ALTER TABLE quantities RENAME COLUMN "groupname" TO "group";
 
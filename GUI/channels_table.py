@@ -61,9 +61,10 @@ class ChannelsTreeWidget(QTreeWidget):
             self.channels_added[cute_name] = im
             self.quantities_added[cute_name] = {}
             self.parent = QTreeWidgetItem([cute_name, model, '', address])
+            values = self.get_values(im)
             for quantity in im.quantities.values():
                 quantity_name = quantity.name
-                value = self.get_value(quantity)
+                value = values[quantity_name]
                 unit = ''
 
                 # Handle this in Quantity Manager -> convert_return_value()
@@ -89,6 +90,19 @@ class ChannelsTreeWidget(QTreeWidget):
             self.logger.error(f"Error querying '{quantity.name}': {e}")
             QtW.QMessageBox.critical(self, f"Error querying '{quantity.name}'", str(e))
 
+    def get_values(self, instrument_manager) -> dict:
+        """Reads all readable quantities of an instrument in bulk, falls back to one query per quantity on error"""
+        quantities = instrument_manager.quantities.values()
+        # write-only quantities and buttons can not be read, they would break the compound query of the others
+        values = {quantity.name: quantity.get_latest_value() for quantity in quantities if not quantity.is_readable}
+        readable = [quantity for quantity in quantities if quantity.is_readable]
+        try:
+            values.update(instrument_manager.get_values([quantity.name for quantity in readable]))
+        except Exception as e:
+            self.logger.error(f"Error querying all quantities of '{instrument_manager.name}': {e}")
+            values.update({quantity.name: self.get_value(quantity) for quantity in readable})
+        return values
+
     def handle_incoming_value(self, value):
         """Handles any value returned by instrument to be properly displayed. Should be implemented by child class"""
         pass
@@ -153,17 +167,17 @@ class ChannelsTreeWidget(QTreeWidget):
         else:
             cute_name = self.parent.text(0)
         _im = self.channels_added[cute_name]
-        _im.update_visibility(quantity_changed, new_value)
+        dependents = _im.update_visibility(quantity_changed, new_value)
         quantity_widgets = self.quantities_added[cute_name]
 
-        for quantity_name, quantity in _im.quantities.items():
-            if quantity_name in quantity_widgets.keys():
-                quantity_widget = quantity_widgets[quantity_name]
+        for quantity in dependents:
+            if quantity.name in quantity_widgets.keys():
+                quantity_widget = quantity_widgets[quantity.name]
                 quantity_widget.setHidden(not quantity.is_visible)
 
-            # Remove all quantities related to this instrument from the Step Sequence and Log Channels tables after a value change in the Channels Table
-            # This is to avoid having non-visible quantities being present in the Step Sequence and Log Channels table
-            self._parent_gui.remove_experiment_quantities(cute_name)
+        # Remove all quantities related to this instrument from the Step Sequence and Log Channels tables after a value change in the Channels Table
+        # This is to avoid having non-visible quantities being present in the Step Sequence and Log Channels table
+        self._parent_gui.remove_experiment_quantities(cute_name)
 
 
     def show_link_frame_gui(self, selected_item):
@@ -270,6 +270,26 @@ class ExperimentWindowGui(QMainWindow):
         self.delay_time.setMinimum(0)
         self.delay_time.setMaximum(float('inf'))
         timing_layout.addRow(QLabel("Delay between step and measure [s]:"), self.delay_time)
+
+        # Instruments are read at the same time, each instrument still answers its queries in order
+        self.parallel_acquisition = QCheckBox()
+        self.parallel_acquisition.setChecked(True)
+        timing_layout.addRow(QLabel("Read instruments in parallel:"), self.parallel_acquisition)
+
+        # Quantities of the same level on different instruments are set at the same time, followed by one delay
+        self.parallel_setting = QCheckBox()
+        self.parallel_setting.setChecked(True)
+        timing_layout.addRow(QLabel("Set instruments in parallel:"), self.parallel_setting)
+
+        # Snake order runs inner levels back and forth, avoiding the jump from stop to start after every pass
+        self.sweep_order = QComboBox()
+        self.sweep_order.addItems(['Linear', 'Snake'])
+        timing_layout.addRow(QLabel("Sweep order:"), self.sweep_order)
+
+        # The innermost level is uploaded to the instrument and stepped by triggers if its driver supports list mode
+        self.hardware_list_mode = QCheckBox()
+        self.hardware_list_mode.setChecked(True)
+        timing_layout.addRow(QLabel("Use instrument list mode:"), self.hardware_list_mode)
         # TODO: Connect later
         # self.delay_time.valueChanged.connect(delay_time_changed)
 
@@ -386,13 +406,21 @@ class ExperimentWindowGui(QMainWindow):
                 quantitiy_managers[(ins, qty)] = self._working_instruments[ins].quantities[qty]
         for (ins, qty) in output_quantities:
             quantitiy_managers[(ins, qty)] = self._working_instruments[ins].quantities[qty]
+
+        # instrument manager objects involved in the experiment, key: instrument_name
+        instrument_managers = {ins: self._working_instruments[ins] for (ins, qty) in quantitiy_managers}
         
         DTO = ExperimentDTO(input_quantities=input_quantities,
                             quantity_sequences=quantity_sequences,
                             output_quantities=output_quantities,
                             quantitiy_managers=quantitiy_managers,
+                            instrument_managers=instrument_managers,
                             delay_time=self.delay_time.value(),
-                            comments=self.comment_box.toPlainText())
+                            comments=self.comment_box.toPlainText(),
+                            parallel_acquisition=self.parallel_acquisition.isChecked(),
+                            parallel_setting=self.parallel_setting.isChecked(),
+                            snake_sweep=self.sweep_order.currentText() == 'Snake',
+                            hardware_list_mode=self.hardware_list_mode.isChecked())
         return DTO
 
 ####################################################################
@@ -402,13 +430,20 @@ class ExperimentWindowGui(QMainWindow):
 class ExperimentDTO:
     def __init__(self, input_quantities: list, quantity_sequences: dict, 
                  output_quantities: list, quantitiy_managers: dict,
-                 delay_time: float, comments: str):
+                 delay_time: float, comments: str, instrument_managers: dict = None,
+                 parallel_acquisition: bool = True, parallel_setting: bool = True, snake_sweep: bool = False,
+                 hardware_list_mode: bool = True):
         self._input_quantities = input_quantities
         self._quantity_sequences = quantity_sequences
         self._output_quantities = output_quantities
         self._quantitiy_managers = quantitiy_managers
+        self._instrument_managers = instrument_managers if instrument_managers else {}
         self._delay_time = delay_time
         self._comments = comments
+        self._parallel_acquisition = parallel_acquisition
+        self._parallel_setting = parallel_setting
+        self._snake_sweep = snake_sweep
+        self._hardware_list_mode = hardware_list_mode
 
     @property
     def input_quantities(self):
@@ -426,10 +461,30 @@ class ExperimentDTO:
     def quantitiy_managers(self):
         return self._quantitiy_managers
 
+    @property
+    def instrument_managers(self):
+        return self._instrument_managers
+
     @property
     def delay_time(self):
         return self._delay_time
     
     @property
     def comments(self):
-        return self._comments
\ No newline at end of file
+        return self._comments
+
+    @property
+    def parallel_acquisition(self):
+        return self._parallel_acquisition
+
+    @property
+    def parallel_setting(self):
+        return self._parallel_setting
+
+    @property
+    def snake_sweep(self):
+        return self._snake_sweep
+
+    @property
+    def hardware_list_mode(self):
+        return self._hardware_list_mode
\ No newline at end of file
@@ -11,8 +11,11 @@ from pymeasure.experiment import Procedure, Results
 from pymeasure.experiment import IntegerParameter, FloatParameter, Parameter
 from datetime import datetime
 
-from itertools import product
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Callable
 import numpy as np
+
+from GUI.sweep_plan import SweepPlan
 ###################################################################################
 # StringParameter
 ###################################################################################
@@ -45,6 +48,13 @@ class MainExperimentProcedure(Procedure):
     output = [] # list with (ins, qty) to measure
     sequence = {} # Dictionary with key -> (ins, qty), value -> sequence details dict: start, stop, number_of_points, data_type
     quantities = {} # Dictionary with key -> (ins, qty), value -> QuantitiyManager object
+    instrument_managers = {} # Dictionary with key -> ins, value -> InstrumentManager object
+    output_by_instrument = {} # Dictionary with key -> ins, value -> list of qty to measure, read with one bulk query
+    parallel_acquisition = True # read all instruments at the same time instead of one after another
+    parallel_setting = True # set the quantities of a level on different instruments at the same time
+    snake_sweep = False # inner levels alternate their direction instead of jumping back to start
+    hardware_list_mode = True # upload the innermost level to the instrument if its driver supports list mode
+    loaded_list = None # points of the innermost level currently uploaded to the instrument
 
     # The columns in the plotter
     DATA_COLUMNS = ['step', 'dummy'] # TO FIX: Plotter Widget needs two columns to initialize
@@ -61,8 +71,17 @@ class MainExperimentProcedure(Procedure):
         self.sequence = DTO.quantity_sequences
         self.output = DTO.output_quantities
         self.quantities = DTO.quantitiy_managers
+        self.instrument_managers = DTO.instrument_managers
+
+        self.output_by_instrument = {}
+        for instrument_name, quantity_name in self.output:
+            self.output_by_instrument.setdefault(instrument_name, []).append(quantity_name)
 
         self.delay_time = DTO.delay_time
+        self.parallel_acquisition = DTO.parallel_acquisition
+        self.parallel_setting = DTO.parallel_setting
+        self.snake_sweep = DTO.snake_sweep
+        self.hardware_list_mode = DTO.hardware_list_mode
 
         for level in self.input:
             for instrument_name, quantity_name in level:
@@ -95,56 +114,177 @@ class MainExperimentProcedure(Procedure):
     def execute(self):
         self.logger.info(f'Starting experiment')
 
-        datapoints = 1 # number of datapoints
-        individual_sequences = []
-        for input_level in self.input:
-            sequences_in_level = []
-            for (ins, qty) in input_level:
-                sequence = self.generate_sequence(self.sequence[(ins, qty)])
-                sequences_in_level.append(sequence)
-                if len(sequence) == 0:
-                    # TODO: handle error
-                    pass
-            datapoints *= len(sequences_in_level[0])
-            """
-            converting [[1, 2, 3], ['a', 'b', 'c']] to [(1, 'a'), (2, 'b'), (3, 'c')]
-            """
-            sequences_in_order = list(zip(*sequences_in_level))
-            individual_sequences.append(sequences_in_order)        
-        
-        combined_sequences = product(*individual_sequences)
+        # the plan knows which levels change at every step, usually only the innermost one
+        plan = SweepPlan([[self.generate_sequence(self.sequence[(ins, qty)]) for (ins, qty) in input_level]
+                          for input_level in self.input], snake=self.snake_sweep)
+        datapoints = len(plan) # number of datapoints
+        self.logger.info(f'Sweeping {datapoints} datapoints with {plan.number_of_sets} set command(s)')
+
+        # level stepped by the instrument itself, None if every point is set by a write
+        list_level = self._hardware_list_level(plan) if self.hardware_list_mode else None
+        self.loaded_list = None
 
         sleep_time = 0.001
-        step = 0
-
-        # Main experiment LOOP
-        for step_sequence in combined_sequences:
-            # step sequence is a list of tupules [(1 , 'a'), (True, )]
-            # The datapoints we record at each "step":
-            print(step_sequence)     
-            data = {}
-            for level in range(len(self.input)):
-                for index in range(len(self.input[level])):
-                    (ins, qty) = self.input[level][index]                
-                    self.quantities[(ins, qty)].set_value(step_sequence[level][index])
-                    data[self.input_data_names[(ins, qty)]] = step_sequence[level][index]
-                    sleep(self.delay_time)                
-
-            for (ins, qty) in self.output:
-                data[self.output_data_names[(ins, qty)]] = self.quantities[(ins, qty)].get_value()
-                sleep(self.delay_time)
-
-            data['step'] = step
-            self.logger.info("Data point recorded: ", data)
-            self.emit('results', data)
-            self.logger.debug(f'Emitting results: {data}')
-            self.emit('progress', 100 * step / datapoints)
-
-            step += 1                
-
-            if self.should_stop():
-                self.logger.warning("Caught the stop flag in the procedure")
-                break
+        # quantities skip set commands of values the instrument already has, e.g. outer levels between steps
+        skipped_writes = self._skipped_writes()
+
+        # instruments without an I/O worker of their own are set and read by this pool in parallel mode
+        instrument_count = len(set(ins for level in self.input for (ins, qty) in level) | set(self.output_by_instrument))
+        io_pool = ThreadPoolExecutor(max_workers=max(1, instrument_count), thread_name_prefix='Experiment I/O')
+        try:
+            # Main experiment LOOP
+            for step, step_values, changed_levels in plan:
+                # step values is a tuple per level [(1 , 'a'), (True, )]
+                # only the levels that changed are set, and only they wait for the instruments to settle
+                for level in changed_levels:
+                    if level == list_level:
+                        # stepped below, after the outer levels
+                        continue
+                    if self.parallel_setting:
+                        self._set_level_in_parallel(level, step_values[level], io_pool)
+                        sleep(self.delay_time)
+                    else:
+                        for (ins, qty), value in zip(self.input[level], step_values[level]):
+                            self.quantities[(ins, qty)].set_value(value)
+                            sleep(self.delay_time)
+
+                # the list is triggered on every step, at the start of a snake pass its first point repeats the last one
+                if list_level is not None:
+                    self._step_hardware_list(plan, step, step_values[list_level])
+                    sleep(self.delay_time)
+
+                # The datapoints we record at each "step":
+                data = {}
+                for level in range(len(self.input)):
+                    for (ins, qty), value in zip(self.input[level], step_values[level]):
+                        data[self.input_data_names[(ins, qty)]] = value
+
+                # all outputs of an instrument are read with as few (compound) queries as possible
+                if self.parallel_acquisition and len(self.output_by_instrument) > 1:
+                    for ins, values in self._read_outputs_in_parallel(io_pool).items():
+                        for qty, value in values.items():
+                            data[self.output_data_names[(ins, qty)]] = value
+                    sleep(self.delay_time)
+                else:
+                    for ins, quantity_names in self.output_by_instrument.items():
+                        values = self.instrument_managers[ins].get_values(quantity_names)
+                        for qty in quantity_names:
+                            data[self.output_data_names[(ins, qty)]] = values[qty]
+                            # same delay per output as when every output was read on its own
+                            sleep(self.delay_time)
+
+                data['step'] = step
+                self.logger.info("Data point recorded: ", data)
+                self.emit('results', data)
+                self.logger.debug(f'Emitting results: {data}')
+                self.emit('progress', 100 * step / datapoints)
+
+                if self.should_stop():
+                    self.logger.warning("Caught the stop flag in the procedure")
+                    break
+        finally:
+            io_pool.shutdown(wait=False)
+
+        self.logger.info(f'Skipped {self._skipped_writes() - skipped_writes} redundant instrument write(s)')
+
+    def _hardware_list_level(self, plan: SweepPlan):
+        """Returns the innermost level if its instrument can step it in list mode, otherwise None"""
+        if not self.input:
+            return None
+
+        level = len(self.input) - 1
+        instrument_names = set(ins for (ins, qty) in self.input[level])
+        if len(instrument_names) != 1 or plan.shape[level] < 2:
+            return None
+
+        ins = instrument_names.pop()
+        im = self.instrument_managers[ins]
+        quantity_names = [qty for (ins, qty) in self.input[level]]
+        if not hasattr(im, 'supports_list_mode') or not im.supports_list_mode(quantity_names):
+            self.logger.info(f'{ins} does not support list mode, stepping level {level} with set commands')
+            return None
+
+        if im.list_max_points and plan.shape[level] > im.list_max_points:
+            self.logger.info(f'Level {level} has more than the {im.list_max_points} list points {ins} supports, '
+                             f'stepping it with set commands')
+            return None
+
+        self.logger.info(f'Stepping level {level} in list mode of {ins}')
+        return level
+
+    def _step_hardware_list(self, plan: SweepPlan, step: int, values: tuple):
+        """Steps the innermost level to the next point of the list, uploading and arming the list at the start of a pass"""
+        level = len(self.input) - 1
+        ins = self.input[level][0][0]
+        im = self.instrument_managers[ins]
+
+        if step % plan.shape[level] == 0:
+            points = plan.inner_pass(step)
+            # linear sweeps repeat the same list on every pass, it is only uploaded once
+            if points != self.loaded_list:
+                im.load_list({qty: [point[index] for point in points]
+                              for index, (ins, qty) in enumerate(self.input[level])})
+                self.loaded_list = points
+            im.arm_list()
+
+        im.trigger_list()
+        for (ins, qty), value in zip(self.input[level], values):
+            self.quantities[(ins, qty)].set_latest_value(value)
+
+    def _set_level_in_parallel(self, level: int, values: tuple, io_pool: ThreadPoolExecutor):
+        """Sets the quantities of a level, the instruments at the same time and each instrument in the level's order
+        Raises:
+            the exception of the first instrument that failed, after all instruments are done
+        """
+        values_by_instrument = dict()
+        for (ins, qty), value in zip(self.input[level], values):
+            values_by_instrument.setdefault(ins, []).append((self.quantities[(ins, qty)], value))
+
+        def set_all(quantity_values):
+            for quantity, value in quantity_values:
+                quantity.set_value(value)
+
+        if len(values_by_instrument) == 1:
+            set_all(next(iter(values_by_instrument.values())))
+            return
+
+        futures = dict()
+        for ins, quantity_values in values_by_instrument.items():
+            futures[ins] = self._submit_to_instrument(self.instrument_managers[ins], set_all, quantity_values,
+                                                      io_pool=io_pool)
+
+        # the step is only aborted when no set is left running
+        wait(futures.values())
+        failed = [ins for ins, future in futures.items() if future.exception() is not None]
+        if failed:
+            self.logger.error(f"Setting level {level} failed for {', '.join(failed)}, aborting the experiment")
+            raise futures[failed[0]].exception()
+
+    def _read_outputs_in_parallel(self, io_pool: ThreadPoolExecutor) -> dict:
+        """Reads the outputs of all instruments at the same time
+        Returns:
+            dictionary with key: instrument name, value: dictionary with key: quantity name, value: value
+        """
+        futures = dict()
+        for ins, quantity_names in self.output_by_instrument.items():
+            im = self.instrument_managers[ins]
+            futures[ins] = self._submit_to_instrument(im, im.get_values, list(quantity_names), io_pool=io_pool)
+
+        # no read is left running when one of them fails
+        wait(futures.values())
+        return {ins: future.result() for ins, future in futures.items()}
+
+    @staticmethod
+    def _submit_to_instrument(im, fn: Callable, *args, io_pool: ThreadPoolExecutor) -> Future:
+        """Runs fn on the I/O worker of the instrument, in order with its other operations.
+        Managers without a worker (NonVisaInstrumentManager, closed managers) run it on io_pool instead
+        """
+        if getattr(im, 'has_io_worker', False):
+            return im.submit(fn, *args)
+        return io_pool.submit(fn, *args)
+
+    def _skipped_writes(self) -> int:
+        return sum(getattr(im, 'skipped_writes', 0) for im in self.instrument_managers.values())
 
 
 ###################################################################################
@@ -18,14 +18,23 @@ class InstrumentManagerGUI(QWidget):
         # set up header
         self.default_value_btn = QPushButton("Set all to default value")
         self.default_value_btn.clicked.connect(self._set_all_default_value)
+        self.refresh_btn = QPushButton("Refresh all")
+        self.refresh_btn.clicked.connect(self._refresh_all_values)
         header_layout = QHBoxLayout()
         header_layout.addStretch()
+        header_layout.addWidget(self.refresh_btn)
         header_layout.addWidget(self.default_value_btn)
         header_widget = QWidget()
         header_widget.setLayout(header_layout)
 
         self.scroll_layout = QVBoxLayout()
 
+        # frames start from the latest values, load all of them with a single request
+        try:
+            self._im.refresh_latest_values()
+        except Exception as e:
+            self.logger.error(f"Could not refresh latest values of '{self._im.name}': {e}")
+
         # add all quantities to layouts dependent on section and group name
         self._build_quanitity_sections()
         # add sections to layout
@@ -126,9 +135,40 @@ class InstrumentManagerGUI(QWidget):
 
     def _set_all_default_value(self):
         """Sets default value to all visible quantities"""
-        for quantity_frame in self.quantity_frames:
-            if quantity_frame.isVisible():
-                quantity_frame.set_default_value()
+        visible_frames = [quantity_frame for quantity_frame in self.quantity_frames if quantity_frame.isVisible()]
+
+        # the set commands are sent as few joined messages, the values are read back with one bulk query
+        try:
+            with self._im.batch():
+                for quantity_frame in visible_frames:
+                    quantity_frame.set_default_value(refresh=False)
+        except Exception as e:
+            # the joined messages are written when the batch ends, a failure there is not caught by the frames
+            self.logger.error(f"Error setting default values of '{self._im.name}': {e}")
+            QtW.QMessageBox.critical(self, f"Error setting '{self._im.name}'", str(e))
+        # show what the instrument actually holds, also after a failed batch
+        self._refresh_values(visible_frames)
+
+    def _refresh_all_values(self):
+        """Reads all visible quantities from the instrument"""
+        self._refresh_values([quantity_frame for quantity_frame in self.quantity_frames if quantity_frame.isVisible()])
+
+    def _refresh_values(self, quantity_frames: list):
+        """Reads the quantities of the frames with as few queries as possible and displays the values"""
+        quantity_frames = [quantity_frame for quantity_frame in quantity_frames if quantity_frame.quantity.is_readable]
+        try:
+            values = self._im.get_values([quantity_frame.quantity.name for quantity_frame in quantity_frames])
+        except Exception as e:
+            self.logger.error(f"Error querying quantities of '{self._im.name}': {e}")
+            QtW.QMessageBox.critical(self, f"Error querying '{self._im.name}'", str(e))
+            return
+
+        for quantity_frame in quantity_frames:
+            try:
+                quantity_frame.handle_incoming_value(values[quantity_frame.quantity.name])
+            except NotImplementedError:
+                # frame does not display values
+                pass
 
     def _handle_section_change(self):
         selected_section_name = self.section_tree.currentItem().text(0)
@@ -142,7 +182,8 @@ class InstrumentManagerGUI(QWidget):
     def _handle_quant_value_change(self, quantity_changed, new_value):
         """Called by QuantityFrame when the quantity's value is changed.
         Sets visibility of other quantities depending on new value"""
-        self._im.update_visibility(quantity_changed, new_value)
+        dependents = self._im.update_visibility(quantity_changed, new_value)
 
         for quantity_frame in self.quantity_frames:
-            quantity_frame.setVisible(quantity_frame.quantity.is_visible)
+            if quantity_frame.quantity in dependents:
+                quantity_frame.setVisible(quantity_frame.quantity.is_visible)
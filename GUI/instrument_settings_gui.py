@@ -4,14 +4,13 @@ This is the Instrument Settings GUI that is used to edit Instrument "driver" par
 from the associated driver INI file.
 """
 
-import requests
-
 from PyQt6 import QtCore
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QScrollArea, QTreeWidget, QTreeWidgetItem, QPushButton,
                              QFrame, QApplication, QMessageBox)
 import logging
 
 from DB import db
+from Instrument.instrument_server_client import get_instrument_server_client
 from GUI.setting_frames import StringSettingFrame, ComboBoxSettingFrame, FileDialogSettingFrame, SettingsGroupBox, \
     SettingFrameDTO, TwoRadioButtonSettingFrame, IntegerSettingFrame, SettingFrame
 
@@ -141,8 +140,7 @@ class InstrumentSettingsGUI(QWidget):
     def _get_settings_for_instrument(self, cute_name):
         """Gets all the settings associated with the instrument"""
         try:
-            url = r'http://127.0.0.1:5000/instrumentDB/getInstrumentSettings'
-            response = requests.get(url, params={'cute_name': cute_name})
+            response = get_instrument_server_client().get('/instrumentDB/getInstrumentSettings', params={'cute_name': cute_name})
             return dict(response.json())
 
         except Exception as ex:
@@ -387,6 +385,9 @@ class InstrumentSettingsGUI(QWidget):
                         cursor.execute(updated_smt)
                         connection.commit()
 
+                    # the cached driver document of the instrument is outdated now
+                    self.flask_app.extensions['driver_cache'].invalidate(frame_dto.unique_key_value)
+
                 except Exception as ex:
                     error_msg = f'There was an ERROR updating instrument settings for ' \
                                 f'instrument {frame_dto.unique_key_value}: {ex}'
@@ -402,8 +403,7 @@ class InstrumentSettingsGUI(QWidget):
 
         prev_instrument_details = dict()
         try:
-            url = r'http://127.0.0.1:5000/instrumentDB/getInstrumentSettings'
-            response = requests.get(url, params={'cute_name': cute_name})
+            response = get_instrument_server_client().get('/instrumentDB/getInstrumentSettings', params={'cute_name': cute_name})
             prev_instrument_details = dict(response.json())
 
         except Exception as ex:
@@ -69,19 +69,22 @@ class QuantityFrame(QtW.QFrame):
 
     def set_value(self):
         try:
-            self.quantity.set_value(self.value)
+            # explicit user actions are always written, the instrument may have been changed from its front panel
+            self.quantity.set_value(self.value, force=True)
             self.on_value_change(self.quantity.name, self.value)
         except Exception as e:
             self.logger.error(f"Error setting '{self.quantity.name}': {e}")
             QtW.QMessageBox.critical(self, f"Error setting '{self.quantity.name}'", str(e))
 
-    def set_default_value(self):
+    def set_default_value(self, refresh: bool = True):
+        """Sets the quantity to its default value. If refresh is False the value is not read back"""
         try:
-            self.quantity.set_default_value()
+            self.quantity.set_default_value(force=True)
         except Exception as e:
             self.logger.error(f"Error setting '{self.quantity.name}': {e}")
             QtW.QMessageBox.critical(self, f"Error setting '{self.quantity.name}'", str(e))
-        self.get_value()
+        if refresh:
+            self.get_value()
 
     def handle_incoming_value(self, value):
         """Handles any value returned by instrument to be properly displayed. Should be implemented by child class"""
@@ -232,7 +235,7 @@ class VectorFrame(QuantityFrame):
         super().__init__(quantity, on_value_change, logger)
         self.setLayout(self.layout)
 
-    def set_default_value(self):
+    def set_default_value(self, refresh: bool = True):
         pass
 
 
@@ -197,7 +197,8 @@ class SequenceConstructor(QDialog):
 
     def set_value(self):
         try:
-            self.quantity.set_value(self.value)
+            # explicit user actions are always written, the instrument may have been changed from its front panel
+            self.quantity.set_value(self.value, force=True)
             self.on_value_change(self.quantity.name, self.value)
         except Exception as e:
             self.logger.error(f"Error setting '{self.quantity.name}': {e}")
@@ -205,7 +206,7 @@ class SequenceConstructor(QDialog):
 
     def set_default_value(self):
         try:
-            self.quantity.set_default_value()
+            self.quantity.set_default_value(force=True)
         except Exception as e:
             self.logger.error(f"Error setting '{self.quantity.name}': {e}")
             QMessageBox.critical(self, f"Error setting '{self.quantity.name}'", str(e))
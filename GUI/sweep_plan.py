@@ -0,0 +1,70 @@
+from typing import NamedTuple
+import numpy as np
+
+
+class SweepStep(NamedTuple):
+    index: int
+    # values of every level, values[level][i] belongs to the i-th quantity of the level
+    values: tuple
+    # levels whose values differ from the previous step, all levels for the first step
+    changed_levels: tuple
+
+
+###################################################################################
+# SweepPlan
+###################################################################################
+class SweepPlan:
+    """Order of the points of a multi level sweep, computed once before the experiment starts.
+    Level 0 is the outermost level, the last level changes on every step.
+    All quantities of a level step together, so their sequences are expected to have the same length.
+    Iterating yields a SweepStep per point, with the levels that have to be set for that point.
+    In snake order every inner level runs backwards on every other pass, so it never jumps back from stop to start.
+    """
+
+    def __init__(self, levels: list, snake: bool = False):
+        """
+        Parameters:
+            levels -- list of levels, each a list with the sequence of values of every quantity in the level
+            snake -- reverse the direction of the inner levels on alternate passes (boustrophedon order)
+        """
+        self.snake = snake
+        # per level: tuple with the values of all quantities of the level, for every point of the level
+        self._points = [tuple(zip(*sequences)) for sequences in levels]
+        self.shape = tuple(len(points) for points in self._points)
+
+        # indices[step, level] is the index of the level's point at that step
+        if self.shape:
+            self.indices = np.indices(self.shape).reshape(len(self.shape), -1).T
+            if snake:
+                step = np.arange(len(self.indices))
+                for level in range(1, len(self.shape)):
+                    # a level runs backwards on every odd pass, one pass covers the level and all inner levels
+                    backwards = (step // int(np.prod(self.shape[level:]))) % 2 == 1
+                    self.indices[backwards, level] = self.shape[level] - 1 - self.indices[backwards, level]
+        else:
+            # no levels, a single step without inputs
+            self.indices = np.zeros((1, 0), dtype=int)
+
+        # changed[step, level] is True if the level has to be set at that step
+        self.changed = np.ones(self.indices.shape, dtype=bool)
+        self.changed[1:] = self.indices[1:] != self.indices[:-1]
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __iter__(self):
+        for step, (indices, changed) in enumerate(zip(self.indices.tolist(), self.changed)):
+            values = tuple(points[index] for points, index in zip(self._points, indices))
+            yield SweepStep(step, values, tuple(np.flatnonzero(changed).tolist()))
+
+    def inner_pass(self, step: int) -> list:
+        """Returns the points of the innermost level in the order they are stepped in the pass containing step"""
+        length = self.shape[-1]
+        start = step - step % length
+        return [self._points[-1][index] for index in self.indices[start:start + length, -1].tolist()]
+
+    @property
+    def number_of_sets(self) -> int:
+        """Number of set_value calls needed by the sweep"""
+        per_level = np.array([len(points[0]) if points else 0 for points in self._points], dtype=int)
+        return int(self.changed.sum(axis=0) @ per_level) if per_level.size else 0
@@ -1,9 +1,16 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+import sys
 from enum import Enum
+import numpy as np
 from pyvisa import ResourceManager
-import requests
 from typing import Callable
 
 from .quantity_manager import QuantityManager
+from .latest_value_store import get_latest_value_store
 
 # Maps terminating character from ini file to actual character
 TERM_CHAR = Enum('TERM_CHAR',
@@ -14,13 +21,88 @@ TERM_CHAR = Enum('TERM_CHAR',
                   'CR+LF': '\r\n'})
 
 
+# struct format characters used by pyvisa for NumPy dtypes, key: (dtype.kind, dtype.itemsize)
+BINARY_DATATYPES = {('f', 2): 'e', ('f', 4): 'f', ('f', 8): 'd',
+                    ('i', 1): 'b', ('i', 2): 'h', ('i', 4): 'i', ('i', 8): 'q',
+                    ('u', 1): 'B', ('u', 2): 'H', ('u', 4): 'I', ('u', 8): 'Q'}
+
+# IEEE 488.2 commands that change the instrument state behind the back of the quantities (reset, recall setup)
+STATE_CHANGING_COMMANDS = ('*RST', '*RCL')
+
+
+def _register_io_thread(io_threads: set):
+    io_threads.add(threading.current_thread())
+
+
+def _join_commands(commands: list, max_length: int) -> list:
+    """Joins SCPI commands into as few semicolon separated messages as possible
+    Every joined command is prefixed with ':' so it is resolved from the root of the command tree
+    Parameters:
+        commands -- commands in the order they must be executed
+        max_length -- maximum length of a message. A longer command is sent on its own
+    Returns:
+        list of (message, number of commands in message)
+    """
+    messages, message, count = [], '', 0
+    for command in commands:
+        command = command.strip()
+        if not command:
+            continue
+
+        if not message:
+            message, count = command, 1
+            continue
+
+        joined = message + ';' + (command if command[0] in '*:' else ':' + command)
+        if len(joined) > max_length:
+            messages.append((message, count))
+            message, count = command, 1
+        else:
+            message, count = joined, count + 1
+
+    if message:
+        messages.append((message, count))
+    return messages
+
+
+class _BatchState(threading.local):
+    # commands buffered by batch() on the calling thread, None outside a batch
+    commands = None
+
+
 ###################################################################################
 # InstrumentManager
 ###################################################################################
 class InstrumentManager:
+    """Manages a VISA instrument and its quantities.
+    All I/O with the instrument is executed in order by a dedicated worker thread, so callers on different
+    threads (GUI, experiment, Flask) can not interleave writes and reads. The queue_* methods return futures,
+    the other methods wait for the result and the *_async methods can be awaited from an asyncio event loop.
+    Writes made inside batch() are joined into semicolon separated messages unless the driver opts out.
+    """
+
+    # defaults for subclasses that do not call InstrumentManager.__init__ (e.g. PicoscopeManager):
+    # operations run on the calling thread, writes are not joined and quantities are queried one at a time
+    _io_worker = None
+    _io_threads = frozenset()
+    _batch_state = None
+    _coalesce_commands = False
+    _max_message_length = 256
+    _compound_queries_supported = False
+
     def __init__(self, name, connection, driver, logger):
         self._name = name
         self._logger = logger
+        # the worker must not reference self, otherwise the manager is never garbage collected
+        self._io_threads = set()
+        self._io_worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'{name} I/O',
+                                             initializer=_register_io_thread, initargs=(self._io_threads,))
+        # commands buffered by batch(), per calling thread
+        self._batch_state = _BatchState()
+        self._coalesce_commands = True
+        self._max_message_length = 256
+        # cleared when the instrument does not answer a compound query as expected
+        self._compound_queries_supported = True
         self._rm = None
         self._instrument = None
         self._driver = driver
@@ -33,6 +115,8 @@ class InstrumentManager:
         self._parity = None
         self.query_errors = None
         self.quantities = dict()
+        # key: name of a state_quant, value: tuple of (dependent quantity, state values as stripped strings)
+        self._dependents = dict()
 
         try:
             # Set VISA driver parameters
@@ -116,6 +200,10 @@ class InstrumentManager:
         self._term_chars = self._driver['visa']['term_char']
         self._send_end = self._driver['visa']['send_end_on_write']
         self._query_errors = self._driver['visa']['query_instr_errors']
+        # drivers added before these settings existed use the defaults
+        self._coalesce_commands = self._driver['visa'].get('coalesce_commands') is not False
+        self._max_message_length = self._driver['visa'].get('max_message_length') or 256
+        self._compound_queries_supported = self._coalesce_commands
 
     def _set_visa_settings_in_visa_resource(self):
         self._instrument.timeout = self._timeout
@@ -148,14 +236,34 @@ class InstrumentManager:
     def _initialize_quantities(self):
         str_true = self._driver['visa']['str_true']
         str_false = self._driver['visa']['str_false']
+        str_value_out = self._driver['visa'].get('str_value_out')
+        suppress_redundant_writes = self._driver['visa'].get('suppress_redundant_writes') is not False
 
         for name, info in self._driver['quantities'].items():
-            self.quantities[name] = QuantityManager(info, self.write, self.read, str_true, str_false, self._logger)
+            self.quantities[name] = QuantityManager(info, self.write, self.read, str_true, str_false, self._logger,
+                                                    query_method=self.ask, submit_method=self.submit,
+                                                    query_binary_method=self.ask_binary_values,
+                                                    str_value_out=str_value_out,
+                                                    suppress_redundant_writes=suppress_redundant_writes)
+
+        # the driver document does not carry the latest values, load all of them with a single request
+        try:
+            self.refresh_latest_values()
+        except Exception as e:
+            self._logger.warning(f"Could not load latest values of '{self.name}': {e}")
+
+        # reverse index of state_quant, so a value change only visits the quantities depending on it
+        dependents = dict()
+        for quantity in self.quantities.values():
+            if quantity.state_quant:
+                state_values = frozenset(str(value).strip() for value in quantity.state_values or ())
+                dependents.setdefault(quantity.state_quant, []).append((quantity, state_values))
+        self._dependents = {name: tuple(entries) for name, entries in dependents.items()}
 
     def _startup(self):
         """Sends relevant start up commands to instrument"""
         if self._driver['visa']['init']:
-            self._instrument.write(self._driver['visa']['init'])
+            self.write(self._driver['visa']['init'])
 
     def close(self):
         """Sends final command to instrument if defined in driver and closes instrument and related resources"""
@@ -163,46 +271,302 @@ class InstrumentManager:
         if self._driver['visa']['final']:
             self.write(self._driver['visa']['final'])
 
-        # close instrument
+        # close instrument after all queued operations
         if self._instrument:
-            self._instrument.close()
+            self.submit(self._instrument.close).result()
         # close resource manager
         if self._rm:
             self._rm.close()
 
+        # stop the I/O worker, later calls are executed on the calling thread
+        io_worker = self._io_worker
+        if io_worker:
+            self._io_worker = None
+            # the worker can not wait for itself
+            io_worker.shutdown(wait=threading.current_thread() not in self._io_threads)
+
+    # region I/O worker
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """Queues fn to be executed by the I/O worker of this instrument
+        Operations submitted from the worker itself (e.g. a write inside a queued get_value) are executed immediately
+        Returns:
+            Future of the result of fn
+        """
+        io_worker = self._io_worker
+        if io_worker is not None and threading.current_thread() not in self._io_threads:
+            return io_worker.submit(fn, *args, **kwargs)
+
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def queue_write(self, msg) -> Future:
+        return self.submit(self._write, msg)
+
+    def queue_read(self) -> Future:
+        return self.submit(self._read)
+
+    def queue_ask(self, msg: str) -> Future:
+        return self.submit(self._ask, msg)
+
+    def queue_get_value(self, quantity) -> Future:
+        return self.submit(self.get_value, quantity)
+
+    def queue_set_value(self, quantity, value) -> Future:
+        return self.submit(self.set_value, quantity, value)
+
+    def queue_get_values(self, quantities: list) -> Future:
+        """Queues get_values, so several instruments can be read at the same time"""
+        return self.submit(self.get_values, list(quantities))
+
+    @property
+    def has_io_worker(self) -> bool:
+        """False if operations are executed by the calling thread, e.g. after close() or in subclasses without a worker"""
+        return self._io_worker is not None
+    # endregion
+
+    # region command coalescing
+    @contextmanager
+    def batch(self):
+        """Buffers the writes of the calling thread and sends them as few semicolon separated messages on exit
+        Reads and queries inside the batch send the buffered commands first, so the order of operations is kept.
+        If the driver sets coalesce_commands to False every command is written on its own as usual.
+        Usage:
+            with instrument_manager.batch():
+                instrument_manager.set_value('Frequency', 1e3)
+                instrument_manager.set_value('Voltage', 0.5)
+        """
+        batch_state = self._batch_state
+        # nested batches are part of the outer one
+        if batch_state is None or batch_state.commands is not None:
+            yield
+            return
+
+        batch_state.commands = []
+        try:
+            yield
+        finally:
+            self._flush_batch()
+            batch_state.commands = None
+
+    def _batched_commands(self):
+        """Returns the command buffer of the calling thread, None if it is not inside a batch"""
+        if not self._coalesce_commands:
+            return None
+        return self._batch_state.commands
+
+    def _flush_batch(self):
+        """Writes the commands buffered by the calling thread"""
+        commands = self._batched_commands()
+        if not commands:
+            return
+
+        messages = _join_commands(commands, self._max_joined_length())
+        commands.clear()
+        try:
+            for message, _ in messages:
+                self.queue_write(message).result()
+        except Exception:
+            # quantities already consider the buffered values as set
+            self.invalidate_cached_state()
+            raise
+
+    def _max_joined_length(self) -> int:
+        # the termination character(s) are appended by pyvisa and count against the message length
+        return self._max_message_length - len(getattr(self._instrument, 'write_termination', None) or '')
+    # endregion
+
+    # region asyncio API
+    def _submit_async(self, fn: Callable, *args) -> asyncio.Future:
+        """Runs fn on the I/O worker and returns an awaitable of its result"""
+        if self._io_worker is None:
+            # no worker (closed, or a subclass without one), keep the event loop free anyway
+            return asyncio.get_running_loop().run_in_executor(None, functools.partial(fn, *args))
+        return asyncio.wrap_future(self.submit(fn, *args))
+
+    async def write_async(self, msg):
+        await self._submit_async(self._write, msg)
+
+    async def read_async(self):
+        return await self._submit_async(self._read)
+
+    async def ask_async(self, msg: str) -> str:
+        return await self._submit_async(self._ask, msg)
+
+    async def get_value_async(self, quantity):
+        return await self._submit_async(self.get_value, quantity)
+
+    async def set_value_async(self, quantity, value):
+        await self._submit_async(self.set_value, quantity, value)
+
+    async def get_values_async(self, quantities: list) -> dict:
+        return await self._submit_async(self.get_values, quantities)
+
+    async def set_values_async(self, values: dict):
+        await self._submit_async(self.set_values, values)
+    # endregion
+
+    # region hardware list mode
+    def supports_list_mode(self, quantities: list) -> bool:
+        """True if the driver declares how to upload, arm and trigger a list of points for all given quantities"""
+        visa_settings = self._driver.get('visa') or dict()
+        if not (visa_settings.get('list_arm_cmd') and visa_settings.get('list_trigger_cmd')):
+            return False
+        return all(getattr(self.quantities.get(quantity), 'list_cmd', None) for quantity in quantities)
+
+    @property
+    def list_max_points(self):
+        """Maximum number of points of a list, None if the driver declares no limit"""
+        return (self._driver.get('visa') or dict()).get('list_max_points')
+
+    def load_list(self, values: dict):
+        """Uploads the points of a sweep, one list per quantity
+        Parameters:
+            values -- dictionary with key: quantity name, value: sequence of values in user form, all of the same length
+        """
+        def load():
+            for quantity, quantity_values in values.items():
+                # the instrument leaves the last written value when the list is stepped
+                self.quantities[quantity].invalidate_cached_state()
+                self.write(self.quantities[quantity].format_list_cmd(quantity_values))
+
+        self.submit(load).result()
+
+    def arm_list(self):
+        """Prepares the loaded list, the first trigger steps to its first point"""
+        self.write(self._driver['visa']['list_arm_cmd'])
+
+    def trigger_list(self):
+        """Steps the armed list to its next point"""
+        self.write(self._driver['visa']['list_trigger_cmd'])
+    # endregion
+
     def ask(self, msg: str) -> str:
-        """Queries instrument
+        """Queries instrument. The write and the read are not interleaved with operations of other threads
         Parameters:
             msg -- message to be written to instrument
         Returns:
             string result from instrument
         """
-        self._instrument.write(msg)
-        return self._instrument.read()
+        self._flush_batch()
+        return self.queue_ask(msg).result()
 
     def write(self, msg):
+        if msg and msg.lstrip(' :').upper().startswith(STATE_CHANGING_COMMANDS):
+            self.invalidate_cached_state()
+
+        commands = self._batched_commands()
+        if commands is not None:
+            if msg:
+                commands.append(msg)
+            return
+
+        self.queue_write(msg).result()
+
+    def read(self):
+        self._flush_batch()
+        return self.queue_read().result()
+
+    def ask_many(self, msgs: list) -> list:
+        """Queries many commands with as few compound queries ('cmd1?;:cmd2?') as possible
+        Falls back to one query per command if the driver opts out of coalescing or the instrument does not answer
+        a compound query with one value per command.
+        Parameters:
+            msgs -- queries to be written to instrument
+        Returns:
+            list of string results from instrument, in the order of msgs
+        """
+        self._flush_batch()
+        return self.submit(self._ask_many, list(msgs)).result()
+
+    def ask_binary_values(self, msg: str, dtype='>f4') -> np.ndarray:
+        """Queries an IEEE 488.2 definite length binary block ('#<n><length><data>')
+        Parameters:
+            msg -- message to be written to instrument
+            dtype -- NumPy dtype of the data including byte order, e.g. '>f4' or '<i2'
+        Returns:
+            NumPy array decoded directly from the block
+        """
+        self._flush_batch()
+        return self.submit(self._ask_binary_values, msg, np.dtype(dtype)).result()
+
+    def _ask(self, msg: str) -> str:
+        self._write(msg)
+        return self._read()
+
+    def _ask_binary_values(self, msg: str, dtype: np.dtype) -> np.ndarray:
+        if (dtype.kind, dtype.itemsize) not in BINARY_DATATYPES:
+            raise ValueError(f"Unsupported binary data type '{dtype}'")
+
+        self._logger.debug(f"Querying binary block '{msg}' from '{self.name}.'")
+        is_big_endian = dtype.byteorder == '>' or (dtype.byteorder == '=' and sys.byteorder == 'big')
+        # a NumPy container makes pyvisa decode the block with np.frombuffer instead of per value
+        return self._instrument.query_binary_values(msg, datatype=BINARY_DATATYPES[(dtype.kind, dtype.itemsize)],
+                                                    is_big_endian=is_big_endian, container=np.array)
+
+    def _ask_many(self, msgs: list) -> list:
+        if len(msgs) > 1 and self._compound_queries_supported:
+            try:
+                replies = []
+                for message, count in _join_commands(msgs, self._max_joined_length()):
+                    reply = self._ask(message)
+                    # a single reply may contain ';' itself
+                    values = [value.strip() for value in reply.split(';')] if count > 1 else [reply]
+                    if len(values) != count:
+                        raise ValueError(f"expected {count} values in reply to '{message}', got '{reply}'")
+                    replies.extend(values)
+                return replies
+
+            except Exception as e:
+                self._logger.warning(f"Compound query failed for '{self.name}', "
+                                     f"querying one command at a time from now on: {e}")
+                self._compound_queries_supported = False
+                # drop a partial reply that may still be in the output buffer
+                try:
+                    self._instrument.clear()
+                except Exception:
+                    pass
+
+        return [self._ask(msg) for msg in msgs]
+
+    def _write(self, msg):
         if msg:
             self._logger.debug(f"Writing '{msg}' to '{self.name}.'")
             self._instrument.write(msg)
 
-    def read(self):
+    def _read(self):
         return self._instrument.read()
 
     def read_values(self, format):
-        return self._instrument.read_values(format)
+        self._flush_batch()
+        return self.submit(self._instrument.read_values, format).result()
 
     def ask_for_values(self, msg, format):
-        self.write(msg)
+        self._flush_batch()
+        return self.submit(self._ask_for_values, msg, format).result()
+
+    def _ask_for_values(self, msg, format):
+        self._write(msg)
         return self._instrument.read_values(format)
 
     def clear(self):
-        self._instrument.clear()
+        self.invalidate_cached_state()
+        self.submit(self._instrument.clear).result()
 
     def trigger(self, ):
-        self._instrument.trigger()
+        self.submit(self._instrument.trigger).result()
+
+    def write_raw(self, message: bytes):
+        """Writes bytes to the instrument without encoding, e.g. a binary block"""
+        self._flush_batch()
+        self.submit(self._instrument.write_raw, message).result()
 
     def read_raw(self):
-        self._instrument.read_raw()
+        self._flush_batch()
+        return self.submit(self._instrument.read_raw).result()
 
     @property
     def name(self):
@@ -224,7 +588,7 @@ class InstrumentManager:
     @timeout.setter
     def timeout(self, value):
         """Sets instrument timeout to value in seconds"""
-        self._instrument.timeout = float(value) * 1000.0
+        self.submit(setattr, self._instrument, 'timeout', float(value) * 1000.0).result()
 
     @property
     def delay(self):
@@ -237,7 +601,7 @@ class InstrumentManager:
         Parameters:
             value -- seconds
         """
-        self._instrument.delay = value
+        self.submit(setattr, self._instrument, 'delay', value).result()
 
     def get_visible_quantities(self) -> list[QuantityManager]:
         """Returns a list of all visible quantities"""
@@ -259,12 +623,39 @@ class InstrumentManager:
         Parameters:
             quantity -- Quantity name as provided in instrument driver
         """
-        value = self.quantities[quantity]
+        value = self.quantities[quantity].get_value()
         self.update_visibility(quantity, value)
         return value
 
+    def get_values(self, quantities: list) -> dict:
+        """Gets values of many quantities in one queued operation, reading them with compound queries where possible
+        Parameters:
+            quantities -- Quantity names as provided in instrument driver
+        Returns:
+            dictionary with key: quantity name, value: value in user form
+        """
+        self._flush_batch()
+        return self.submit(self._get_values, list(quantities)).result()
+
+    def _get_values(self, quantities: list) -> dict:
+        compound = [quantity for quantity in quantities if self.quantities[quantity].supports_compound_query]
+        replies = dict(zip(compound, self._ask_many([self.quantities[quantity].get_cmd for quantity in compound])))
+
+        values = dict()
+        for quantity in quantities:
+            if quantity in replies:
+                values[quantity] = self.quantities[quantity].handle_read_value(replies[quantity])
+                self.update_visibility(quantity, values[quantity])
+            else:
+                values[quantity] = self.get_value(quantity)
+        return values
+
     def get_latest_value(self, quantity):
-        return self.quantities[quantity].latest
+        return self.quantities[quantity].get_latest_value()
+
+    def refresh_latest_values(self):
+        """Reloads the latest value of all quantities from the Instrument Server in one request"""
+        get_latest_value_store().refresh([(self.name, name) for name in self.quantities])
 
     def set_default_value(self, quantity):
         """Sets default value for given quantity
@@ -285,23 +676,48 @@ class InstrumentManager:
         self.quantities[quantity].set_value(value)
         self.update_visibility(quantity, value)
 
-    def update_visibility(self, quantity_changed, new_value):
+    def set_values(self, values: dict):
+        """Sets many quantities in one queued operation, in the order of values. The commands are coalesced
+        Parameters:
+            values -- dictionary with key: quantity name, value: value to set quantity
+        """
+        def set_all():
+            with self.batch():
+                for quantity, value in values.items():
+                    self.set_value(quantity, value)
+
+        self.submit(set_all).result()
+
+    @property
+    def skipped_writes(self) -> int:
+        """Number of set commands that were not sent because the instrument already had the value"""
+        return sum(quantity.skipped_writes for quantity in self.quantities.values())
+
+    def invalidate_cached_state(self):
+        """Forgets the values confirmed by the instrument, the next set_value of every quantity is written"""
+        for quantity in self.quantities.values():
+            quantity.invalidate_cached_state()
+
+    def update_visibility(self, quantity_changed, new_value) -> list[QuantityManager]:
         """Updates visibility of all quantities whose state_quant is the quantity_changed
             Parameters:
                 quantity_changed -- qunatity whose value was just changed
                 new_value -- value that quantity was just changed to
+            Returns:
+                the quantities whose visibility was updated
         """
+        dependents = self._dependents.get(quantity_changed)
+        if not dependents:
+            return []
+
         converted_value = self.quantities[quantity_changed].convert_return_value(new_value)
+        # allows user to insert either the user form or command form of the state value in .ini
+        values = {str(converted_value).strip(), str(new_value).strip()}
 
-        for quantity in self.quantities.values():
-            if quantity.state_quant != quantity_changed:
-                continue
+        for quantity, state_values in dependents:
+            quantity.is_visible = not values.isdisjoint(state_values)
 
-            # allows user to insert either the user form or command form of the state value in .ini
-            if str(converted_value) in quantity.state_values or str(new_value) in quantity.state_values:
-                quantity.is_visible = True
-            else:
-                quantity.is_visible = False
+        return [quantity for quantity, _ in dependents]
 
     def _is_serial_instrument(self):
         """Does current instrument use serial to communicate?"""
@@ -0,0 +1,100 @@
+from __future__ import annotations
+import os
+import threading
+from typing import Optional
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Default settings of the Instrument Server client, the base URL can be overridden with INSTRUMENT_SERVER_URL
+# CONNECT_TIMEOUT, READ_TIMEOUT -- seconds to wait for the connection and for the response
+# RETRIES, BACKOFF_FACTOR -- failed connections and 502/503/504 responses are retried with exponential backoff
+# POOL_SIZE -- number of keep-alive connections kept open to the server
+BASE_URL = os.environ.get('INSTRUMENT_SERVER_URL', 'http://127.0.0.1:5000')
+CONNECT_TIMEOUT = float(os.environ.get('INSTRUMENT_SERVER_CONNECT_TIMEOUT', 3.0))
+READ_TIMEOUT = float(os.environ.get('INSTRUMENT_SERVER_READ_TIMEOUT', 30.0))
+RETRIES = 3
+BACKOFF_FACTOR = 0.1
+POOL_SIZE = 10
+
+
+###################################################################################
+# InstrumentServerClient
+###################################################################################
+class InstrumentServerClient:
+    """HTTP client for the Instrument Server.
+    Keeps a pool of keep-alive connections so calls do not set up a new TCP connection every time.
+    Only requests that are safe to repeat (GET, PUT) are retried after the request was sent,
+    POST requests are only retried if the connection could not be established.
+    """
+
+    def __init__(self, base_url: str = BASE_URL, connect_timeout: float = CONNECT_TIMEOUT,
+                 read_timeout: float = READ_TIMEOUT, retries: int = RETRIES, backoff_factor: float = BACKOFF_FACTOR,
+                 pool_size: int = POOL_SIZE):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+
+        retry = Retry(total=retries, connect=retries, read=retries, status=retries, backoff_factor=backoff_factor,
+                      status_forcelist=(502, 503, 504), allowed_methods=frozenset({'GET', 'PUT', 'HEAD'}),
+                      raise_on_status=False)
+        self._session = self._create_session(HTTPAdapter(pool_connections=1, pool_maxsize=pool_size,
+                                                         max_retries=retry))
+        # used for requests that must not be repeated, e.g. shutting the server down
+        self._single_attempt_session = self._create_session(HTTPAdapter(pool_connections=1, pool_maxsize=1,
+                                                                        max_retries=0))
+
+    @staticmethod
+    def _create_session(adapter: HTTPAdapter) -> requests.Session:
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def url(self, path: str) -> str:
+        """Returns the full URL of an Instrument Server route, e.g. url('/instrumentDB/getInstrument')"""
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def request(self, method: str, path: str, retry: bool = True, **kwargs) -> requests.Response:
+        kwargs.setdefault('timeout', self.timeout)
+        session = self._session if retry else self._single_attempt_session
+        return session.request(method, self.url(path), **kwargs)
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request('POST', path, **kwargs)
+
+    def put(self, path: str, **kwargs) -> requests.Response:
+        return self.request('PUT', path, **kwargs)
+
+    def close(self):
+        self._session.close()
+        self._single_attempt_session.close()
+
+
+_instrument_server_client: Optional[InstrumentServerClient] = None
+_instrument_server_client_lock = threading.Lock()
+
+
+def get_instrument_server_client() -> InstrumentServerClient:
+    """Returns the Instrument Server client shared by this process"""
+    global _instrument_server_client
+
+    with _instrument_server_client_lock:
+        if _instrument_server_client is None:
+            _instrument_server_client = InstrumentServerClient()
+
+    return _instrument_server_client
+
+
+def configure_instrument_server_client(**kwargs) -> InstrumentServerClient:
+    """Replaces the shared client, e.g. to use another base URL. Takes the arguments of InstrumentServerClient"""
+    global _instrument_server_client
+
+    with _instrument_server_client_lock:
+        if _instrument_server_client is not None:
+            _instrument_server_client.close()
+        _instrument_server_client = InstrumentServerClient(**kwargs)
+
+    return _instrument_server_client
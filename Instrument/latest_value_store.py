@@ -0,0 +1,219 @@
+from __future__ import annotations
+import atexit
+import logging
+import os
+import threading
+from typing import Callable, Optional
+from .instrument_server_client import get_instrument_server_client
+
+# Default flush policy of the latest value store, can be overridden with environment variables
+# or changed at runtime with configure_latest_value_store()
+# FLUSH_INTERVAL -- seconds between background flushes (0 writes every value through immediately)
+# MAX_PENDING -- number of pending values that triggers a flush before the interval elapses
+FLUSH_INTERVAL = float(os.environ.get('LATEST_VALUE_FLUSH_INTERVAL', 1.0))
+MAX_PENDING = int(os.environ.get('LATEST_VALUE_MAX_PENDING', 100))
+
+
+def encode_latest_value(value):
+    """Returns the value as it is stored in the latest_value column (text), None stays None"""
+    if value is None or isinstance(value, str):
+        return value
+    return str(value)
+
+
+def persist_latest_values(values: dict):
+    """Writes latest values to the Instrument Server with one request
+    Parameters:
+        values -- dictionary with key: (cute_name, label), value: latest value
+    """
+    response = get_instrument_server_client().put('/instrumentDB/setLatestValues', json=[[cute_name, label, encode_latest_value(value)] for (cute_name, label), value in values.items()])
+    if response.status_code >= 300:
+        response.raise_for_status()
+
+
+def fetch_latest_values(quantities: list) -> dict:
+    """Reads latest values from the Instrument Server with one request
+    Parameters:
+        quantities -- list of (cute_name, label)
+    Returns:
+        dictionary with key: (cute_name, label), value: latest value
+    """
+    response = get_instrument_server_client().post('/instrumentDB/getLatestValues', json=[[cute_name, label] for cute_name, label in quantities])
+    if response.status_code >= 300:
+        response.raise_for_status()
+
+    return {(cute_name, label): value
+            for cute_name, labels in dict(response.json()).items() for label, value in labels.items()}
+
+
+###################################################################################
+# LatestValueStore
+###################################################################################
+class LatestValueStore:
+    """In-memory store of the latest value of each quantity of the connected instruments.
+    Reads are served from memory, changed values are persisted to the quantities table by a background thread.
+    """
+
+    def __init__(self, persist_method: Callable = persist_latest_values, flush_interval: float = FLUSH_INTERVAL,
+                 max_pending: int = MAX_PENDING, logger: logging.Logger = None):
+        self._persist_method = persist_method
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._logger = logger if logger else logging.getLogger()
+
+        # key: (cute_name, label), value: latest value
+        self._values = dict()
+        # values that have not been persisted yet, same layout as _values
+        self._pending = dict()
+        # keys whose latest value is kept in memory only (e.g. vectors), the persisted value is stale for them
+        self._memory_only = set()
+
+        self._lock = threading.Lock()
+        # Serializes flushes so that an older value can never be persisted after a newer one
+        self._flush_lock = threading.Lock()
+        self._wake_up = threading.Event()
+        self._closed = False
+
+        self._worker = threading.Thread(target=self._run, name='LatestValueStore', daemon=True)
+        self._worker.start()
+
+    def contains(self, cute_name: str, label: str) -> bool:
+        return (cute_name, label) in self._values
+
+    def get(self, cute_name: str, label: str, default=None):
+        """Returns the latest known value of the quantity or default if it is unknown"""
+        return self._values.get((cute_name, label), default)
+
+    def seed(self, cute_name: str, label: str, value):
+        """Stores a value that is already persisted (e.g. read from the database). Does not overwrite newer values"""
+        with self._lock:
+            self._values.setdefault((cute_name, label), value)
+
+    def set(self, cute_name: str, label: str, value, persist: bool = True):
+        """Stores the latest value of the quantity and schedules it to be persisted"""
+        with self._lock:
+            self._values[(cute_name, label)] = value
+            if not persist:
+                self._memory_only.add((cute_name, label))
+                return
+            self._memory_only.discard((cute_name, label))
+            self._pending[(cute_name, label)] = value
+            pending_count = len(self._pending)
+
+        if not self.flush_interval:
+            self.flush()
+        elif pending_count >= self.max_pending:
+            self._wake_up.set()
+
+    def refresh(self, quantities: list, fetch_method: Callable = fetch_latest_values):
+        """Reloads the persisted values of many quantities with one request.
+        Values not yet persisted and values kept in memory only are kept
+        Parameters:
+            quantities -- list of (cute_name, label)
+        """
+        values = fetch_method(quantities)
+        with self._lock:
+            for key, value in values.items():
+                if key not in self._pending and key not in self._memory_only:
+                    self._values[key] = value
+
+    def configure(self, flush_interval: float = None, max_pending: int = None, persist_method: Callable = None):
+        """Changes the flush policy, arguments that are not given keep their current value"""
+        if persist_method is not None:
+            self._persist_method = persist_method
+        if flush_interval is not None:
+            self.flush_interval = flush_interval
+        if max_pending is not None:
+            self.max_pending = max_pending
+
+        # the background thread starts waiting with the new interval
+        self._wake_up.set()
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def flush(self, cute_name: Optional[str] = None):
+        """Persists all pending values now
+        Parameters:
+            cute_name -- if given, only the pending values of this instrument are persisted
+        """
+        with self._flush_lock:
+            with self._lock:
+                if cute_name is None:
+                    values = self._pending
+                    self._pending = dict()
+                else:
+                    values = {key: value for key, value in self._pending.items() if key[0] == cute_name}
+                    for key in values:
+                        del self._pending[key]
+
+            # a value that can not be encoded would fail every flush, it is dropped instead of retried
+            encoded_values = dict()
+            for key, value in values.items():
+                try:
+                    encoded_values[key] = encode_latest_value(value)
+                except Exception as e:
+                    self._logger.error(f'Dropping latest value of {key[1]} of {key[0]}, it can not be persisted: {e}')
+            values = encoded_values
+
+            if not values:
+                return
+
+            try:
+                self._persist_method(values)
+            except Exception:
+                # put values back unless they were replaced in the meantime, so they are retried on the next flush
+                with self._lock:
+                    for key, value in values.items():
+                        self._pending.setdefault(key, value)
+                raise
+
+    def close(self):
+        """Stops the background thread and persists all pending values"""
+        self._closed = True
+        self._wake_up.set()
+        self._worker.join(timeout=self.flush_interval + 5.0 if self.flush_interval else 5.0)
+        self.flush()
+
+    def _run(self):
+        while not self._closed:
+            self._wake_up.wait(self.flush_interval if self.flush_interval else None)
+            self._wake_up.clear()
+            if self._closed:
+                break
+
+            try:
+                self.flush()
+            except Exception as e:
+                self._logger.error(f'Could not persist {self.pending_count} latest value(s): {e}')
+
+
+_latest_value_store: Optional[LatestValueStore] = None
+_latest_value_store_lock = threading.Lock()
+
+
+def get_latest_value_store() -> LatestValueStore:
+    """Returns the latest value store shared by all quantities of this process"""
+    global _latest_value_store
+
+    with _latest_value_store_lock:
+        if _latest_value_store is None:
+            _latest_value_store = LatestValueStore()
+            atexit.register(_latest_value_store.close)
+
+    return _latest_value_store
+
+
+def configure_latest_value_store(flush_interval: float = None, max_pending: int = None,
+                                 persist_method: Callable = None) -> LatestValueStore:
+    """Changes the flush policy of the shared store. Arguments that are not given keep their current value
+    Parameters:
+        flush_interval -- seconds between background flushes (0 writes every value through immediately)
+        max_pending -- number of pending values that triggers a flush before the interval elapses
+        persist_method -- called with a dictionary with key: (cute_name, label), value: latest value as text.
+                          Inside the Instrument Server process the values are handed to its writer directly
+    """
+    store = get_latest_value_store()
+    store.configure(flush_interval, max_pending, persist_method)
+    return store
@@ -1,4 +1,4 @@
-import requests
+from Instrument.latest_value_store import fetch_latest_values, persist_latest_values
 
 
 class NonVisaInstrumentManager:
@@ -34,29 +34,29 @@ class NonVisaInstrumentManager:
     '''Set's default value for given quantity'''
 
     def get_value(self, quantity):
-        url = r'http://localhost:5000/instrumentDB/getLatestValue'
-        response = requests.get(url, params={'cute_name': self._name, 'label': quantity})
-        if 300 > response.status_code <= 200:
-            # success
-            pass
-        else:
-            response.raise_for_status()
+        return self.get_values([quantity])[quantity]
 
-        value = response.json()
-        if value['latest_value'] is None:
-            return self.quantities[quantity]['def_value']
-        else:
-            return value['latest_value']
+    def get_values(self, quantities: list) -> dict:
+        """Returns the latest value of many quantities with a single request to the Instrument Server"""
+        latest_values = fetch_latest_values([(self._name, quantity) for quantity in quantities])
+
+        values = {}
+        for quantity in quantities:
+            value = latest_values.get((self._name, quantity))
+            if value is None:
+                values[quantity] = self.quantities[quantity]['def_value']
+            else:
+                values[quantity] = value
+        return values
 
     def set_value(self, quantity, value):
-        self._check_limits(quantity, value)
-        url = r'http://localhost:5000/instrumentDB/setLatestValue'
-        response = requests.put(url, params={'cute_name': self._name, 'label': quantity, 'latest_value': value})
-        if 300 > response.status_code <= 200:
-            # success
-            pass
-        else:
-            response.raise_for_status()
+        self.set_values({quantity: value})
+
+    def set_values(self, values: dict):
+        """Sets many quantities with a single request to the Instrument Server"""
+        for quantity, value in values.items():
+            self._check_limits(quantity, value)
+        persist_latest_values({(self._name, quantity): value for quantity, value in values.items()})
 
     def _check_limits(self, quantity, value):
         """Checks value against the limits or state values (for a combo) of a quantity
@@ -1,13 +1,12 @@
-import requests
 import sys
 import importlib
 import logging
 import os
+from Instrument.instrument_server_client import get_instrument_server_client
 
 name = "Picoscope 6000"
 
-url = r'http://127.0.0.1:5000/instrumentDB/getInstrument'
-response = requests.get(url, params={'cute_name': name})
+response = get_instrument_server_client().get('/instrumentDB/getInstrument', params={'cute_name': name})
 driver = dict(response.json())
 
 driver = driver["general_settings"]["driver_path"]
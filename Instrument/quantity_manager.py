@@ -1,10 +1,32 @@
 from __future__ import annotations
+import asyncio
+import logging
 from typing import Callable
-import requests
+import numpy as np
+
+from .latest_value_store import LatestValueStore, get_latest_value_store
+from .instrument_server_client import get_instrument_server_client
+
+
+# Byte order and format of binary vector data when the driver does not declare vector_dtype
+# IEEE 488.2 sends the most significant byte first by default
+DEFAULT_VECTOR_DTYPE = '>f4'
+VECTOR_DATA_TYPES = ('VECTOR', 'VECTOR_COMPLEX')
+
+
+def _format_double(value, value_format: str) -> str:
+    """Formats a DOUBLE value with the str_value_out format of the driver, values that are no number are sent as they are"""
+    try:
+        return value_format % float(value)
+    except (TypeError, ValueError):
+        return str(value)
 
 
 class QuantityManager:
-    def __init__(self, quantity_info: dict, write_method: Callable, read_method: Callable, str_true, str_false, logger=None):
+    def __init__(self, quantity_info: dict, write_method: Callable, read_method: Callable, str_true, str_false, logger=None,
+                 latest_value_store: LatestValueStore = None, query_method: Callable = None,
+                 submit_method: Callable = None, query_binary_method: Callable = None, str_value_out: str = None,
+                 suppress_redundant_writes: bool = False):
         self.instrument_name = quantity_info['cute_name']
         self.name = quantity_info['label']
         self.data_type = quantity_info['data_type'].upper()
@@ -26,21 +48,63 @@ class QuantityManager:
         self.show_in_measurement_dlg = quantity_info['show_in_measurement_dlg']
         self.set_cmd = str(quantity_info['set_cmd'])
         self.get_cmd = str(quantity_info['get_cmd'])
-        self.latest_value = quantity_info['latest_value']
+        # drivers added before hardware list mode existed have no such key
+        self.list_cmd = quantity_info.get('list_cmd')
+        # drivers added before vector_dtype existed have no such key
+        self.vector_dtype = np.dtype(quantity_info.get('vector_dtype') or DEFAULT_VECTOR_DTYPE)
         self.is_visible = True
 
+        # latest values are kept in memory and persisted to the Instrument Server in the background
+        self._latest_values = latest_value_store if latest_value_store else get_latest_value_store()
+        # driver documents served by getInstrument leave out the latest values, InstrumentManager loads them in bulk
+        if 'latest_value' in quantity_info:
+            self._latest_values.seed(self.instrument_name, self.name, quantity_info['latest_value'])
+
         self._write_method = write_method
         self._read_method = read_method
+        # writes the command and reads the answer without other I/O in between, falls back to write + read
+        self._query_method = query_method
+        # queues a call on the I/O worker of the instrument and returns a concurrent.futures.Future
+        self._submit_method = submit_method
+        # queries an IEEE 488.2 definite length binary block and returns it as NumPy array of the given dtype
+        self._query_binary_method = query_binary_method
         self.str_true = str_true
         self.str_false = str_false
+        self.str_value_out = str_value_out
+        self._logger = logger if logger else logging.getLogger()
+
+        # skip set commands of values the instrument already has, the quantity setting overrides the driver setting
+        # buttons trigger an action and vectors are too large to compare, they are always written
+        if quantity_info.get('suppress_redundant_writes') is not None:
+            suppress_redundant_writes = bool(quantity_info['suppress_redundant_writes'])
+        self.suppress_redundant_writes = suppress_redundant_writes and \
+            self.data_type not in ('BUTTON',) + VECTOR_DATA_TYPES
+        # set command of the value last written to the instrument, None if the instrument state is unknown
+        self._confirmed_cmd = None
+        self.skipped_writes = 0
+
+        # lookup tables and command template used by convert_value, convert_return_value and set_value
+        self._compile_codecs()
 
         # If quantity is linked to another, when get/set are called, it calls the corresponding linked quantity instead
         self.linked_quantity_get: QuantityManager = None
         self.linked_quantity_set: QuantityManager = None
 
+    @property
+    def latest_value(self):
+        """Latest known value of the quantity in command form"""
+        return self._latest_values.get(self.instrument_name, self.name)
+
+    @latest_value.setter
+    def latest_value(self, value):
+        # traces are too large to be persisted, they are kept in memory only
+        self._latest_values.set(self.instrument_name, self.name, value, persist=self.data_type not in VECTOR_DATA_TYPES)
+
     # region set_value methods
-    def set_value(self, value):
-        """Sets quantity value to <value>"""
+    def set_value(self, value, force: bool = False):
+        """Sets quantity value to <value>.
+        If force is True the command is written even if the instrument is known to hold the value already
+        """
         if self.linked_quantity_set:
             self.linked_quantity_set.set_latest_value(value)
             return
@@ -48,46 +112,52 @@ class QuantityManager:
         value = self.convert_value(value)
 
         # add the value to the command and write to instrument
-        cmd = self.set_cmd
-        if "<*>" in cmd:
-            cmd = cmd.replace("<*>", str(value))
-        else:
-            cmd += f' {value}'
-
-
-        value = self.convert_value(value)
-        # add the value to the command and write to instrument
-        cmd = self.set_cmd
-        if "<*>" in cmd:
-            cmd = cmd.replace("<*>", str(value))
-        else:
-            cmd += f' {value}'
+        cmd = self.format_set_cmd(value)
+        if self.suppress_redundant_writes and not force and cmd == self._confirmed_cmd:
+            self.skipped_writes += 1
+            return
 
+        # the state is unknown if the write fails
+        self._confirmed_cmd = None
         self._write_method(cmd)
+        self._confirmed_cmd = cmd
         self.latest_value = value
 
-    def set_default_value(self):
+    def format_set_cmd(self, value) -> str:
+        """Returns the set command for a value in command form"""
+        return self._format_value(value).join(self._set_cmd_parts)
+
+    def format_list_cmd(self, values) -> str:
+        """Returns the command uploading a list of values (in user form) for hardware list mode
+            Raises: ValueError
+        """
+        if not self.list_cmd:
+            raise ValueError(f"Quantity '{self.name}' of {self.instrument_name} does not support list mode.")
+
+        str_values = ','.join(self._format_value(self.convert_value(value)) for value in values)
+        if '<*>' in self.list_cmd:
+            return self.list_cmd.replace('<*>', str_values)
+        return f'{self.list_cmd} {str_values}'
+
+    def set_default_value(self, force: bool = False):
         """Sets quantity value to default value as defined in driver"""
         if self.linked_quantity_set:
-            self.linked_quantity_set.set_default_value()
+            self.linked_quantity_set.set_default_value(force)
             return
 
-        self.set_value(self.default_value)
+        self.set_value(self.default_value, force)
 
     def set_latest_value(self, value):
-        """Sets quantity's latest_value in database to <value>"""
+        """Sets quantity's latest_value to <value>. It is persisted to the database in the background"""
         if self.linked_quantity_set:
             self.linked_quantity_set.set_latest_value(value)
             return
 
         self.latest_value = value
 
-        # send to server
-        url = r'http://127.0.0.1:5000/instrumentDB/setLatestValue'
-        response = requests.put(url, params={
-            'cute_name': self.instrument_name, 'label': self.name, 'latest_value': value})
-        if response.status_code >= 300:
-            response.raise_for_status()
+    async def set_value_async(self, value):
+        """Sets quantity value to <value> on the I/O worker of the instrument"""
+        await self._run_async(self.set_value, value)
     # endregion
 
     # region get_value methods
@@ -96,63 +166,100 @@ class QuantityManager:
         if self.linked_quantity_get:
             return self.linked_quantity_get.get_value()
 
-        self._write_method(self.get_cmd)
-        value = self._read_method()
+        # vectors are transferred as binary blocks, not as text
+        if self.data_type in VECTOR_DATA_TYPES and self._query_binary_method:
+            return self.handle_read_value(self._query_binary_method(self.get_cmd, self.vector_dtype))
+
+        if self._query_method:
+            value = self._query_method(self.get_cmd)
+        else:
+            self._write_method(self.get_cmd)
+            value = self._read_method()
+
+        return self.handle_read_value(value)
+
+    def handle_read_value(self, value):
+        """Stores a value read from the instrument as latest value and returns it in user form"""
+        if self.data_type in VECTOR_DATA_TYPES:
+            # traces are too large to be persisted on every read, keep them in memory only
+            value = self.convert_return_value(value)
+            self._latest_values.set(self.instrument_name, self.name, value, persist=False)
+            return value
 
-        # update latest value
         self.set_latest_value(value)
-        return self.convert_return_value(value)
+        value = self.convert_return_value(value)
+
+        # the instrument drifted away from the value written last, e.g. changed from its front panel
+        if self._confirmed_cmd is not None and self._format_read_value(value) != self._confirmed_cmd:
+            self._confirmed_cmd = None
+
+        return value
+
+    @property
+    def supports_compound_query(self) -> bool:
+        """True if get_cmd can be sent as part of a compound query of the instrument"""
+        return self._query_method is not None and self.linked_quantity_get is None and self.is_readable \
+            and self.data_type not in VECTOR_DATA_TYPES
+
+    @property
+    def is_readable(self) -> bool:
+        """True if the quantity can be read from the instrument"""
+        # get_cmd is NULL (the string 'None' here) when the driver defines neither get_cmd nor set_cmd.
+        # Drivers added before that was stored explicitly hold the column default 'set_cmd?' instead
+        return self.permission in ('BOTH', 'READ') and self.data_type != 'BUTTON' \
+            and self.get_cmd.strip() not in ('', 'None', 'set_cmd?')
 
     def get_latest_value(self):
         """Returns quantity latest_value in database in user form"""
         if self.linked_quantity_get:
             return self.linked_quantity_get.get_latest_value()
 
-        # query server
-        url = r'http://127.0.0.1:5000/instrumentDB/getLatestValue'
-        response = requests.get(url, params={'cute_name': self.instrument_name, 'label': self.name})
+        if self._latest_values.contains(self.instrument_name, self.name):
+            return self.latest_value
+
+        # value is not known in this process, query server
+        response = get_instrument_server_client().get('/instrumentDB/getLatestValue', params={'cute_name': self.instrument_name, 'label': self.name})
 
         if 300 > response.status_code >= 200:
-            self.latest_value = dict(response.json())['latest_value']
-            return self.latest_value
+            latest_value = dict(response.json())['latest_value']
+            self._latest_values.seed(self.instrument_name, self.name, latest_value)
+            return latest_value
         else:
             response.raise_for_status()
+
+    async def get_value_async(self):
+        """Returns quantity value in user form, read on the I/O worker of the instrument"""
+        return await self._run_async(self.get_value)
     # endregion
 
+    def invalidate_cached_state(self):
+        """Forgets the value confirmed by the instrument, the next set_value is written"""
+        self._confirmed_cmd = None
+
     def convert_value(self, value):
         """Converts given value from user form to command form
             Raises: ValueError
         """
 
         if self.data_type == 'BOOLEAN':
-            value = str(value).strip()
-
-            if value.upper() in ("TRUE", self.str_true.upper()):
-                return self.str_true
-            elif value.upper() in ("FALSE", self.str_false.upper()):
-                return self.str_false
-            else:
+            try:
+                return self._to_command[str(value).strip().upper()]
+            except KeyError:
                 raise ValueError(f"{value} is not a valid boolean value.")
 
         # Check Combo values
         elif self.data_type == 'COMBO':
-            value = value.strip()
-
             # combo quantity contains no states or commands
             if not self.combo_cmd:
                 raise ValueError(
                     f"Quantity {self.name} of type 'COMBO' has no associated states or commands. Please update the "
                     f"driver and reupload to the Instrument Server.")
 
-                # if user provided name of the state, convert it to command value
-            if value in (combo.strip() for combo in self.combo_cmd.keys()):
-                return self.combo_cmd[value]
-            # return given value as it is already a valid value for the command
-            elif value in (combo.strip() for combo in self.combo_cmd.values()):
-                return value
-            # incorrect value given, raise error
-            else:
-                raise ValueError(f"Quantity '{self.name}' of type 'COMBO' has no ")
+            # name of the state is converted to its command value, a valid command value is returned as it is
+            try:
+                return self._to_command[str(value).strip()]
+            except KeyError:
+                raise ValueError(f"Quantity '{self.name}' of type 'COMBO' has no state or command '{value}'.")
 
         else:
             return value
@@ -164,28 +271,26 @@ class QuantityManager:
 
         # change driver specified boolean values to boolean value
         if self.data_type == 'BOOLEAN':
-            value = str(value).strip()
-            if value in (self.str_true.upper(), str(True)):
-                return True
-            elif value in (self.str_false.upper(), str(False)):
-                return False
-            else:
+            try:
+                return self._to_user[str(value).strip()]
+            except KeyError:
                 raise ValueError(f"{self.name} returned an invalid value for {self.instrument_name}. "
                                  f"{value} is not a valid boolean value. Please check instrument driver.")
 
         # Instrument will return instrument-defined value, convert it to driver-defined value
         elif self.data_type == 'COMBO':
-            value = value.strip()
-
             # key contains driver-defined value, cmd contains instrument-defined value
             # need to return driver-defined value
-            for key, cmd in self.combo_cmd.items():
-                if value in (key.strip(), cmd.strip()):
-                    return key
+            try:
+                return self._to_user[str(value).strip()]
+            except KeyError:
+                raise ValueError(
+                    f"{self.name} returned an invalid value for {self.instrument_name}. "
+                    f"{value} is not a valid combo value. Please check instrument driver.")
 
-            raise ValueError(
-                f"{self.name} returned an invalid value for {self.name}. "
-                f"{value} is not a valid combo value. Please check instrument driver.")
+        # instruments send complex vectors as interleaved real and imaginary parts
+        elif self.data_type == 'VECTOR_COMPLEX' and isinstance(value, np.ndarray) and not np.iscomplexobj(value):
+            return np.ascontiguousarray(value, dtype=np.float64).view(np.complex128)
 
         else:
             return value
@@ -220,4 +325,58 @@ class QuantityManager:
             if value not in valid_states and value not in valid_cmds:
                 raise ValueError(
                     f"{value} is not a recognized state of {self.name}'s states. Valid states are {valid_states}.")
+
+    def _format_read_value(self, value):
+        """Returns the set command of a value read from the instrument (in user form), None if it can not be set"""
+        try:
+            return self.format_set_cmd(self.convert_value(value))
+        except ValueError:
+            return None
+
+    def _compile_codecs(self):
+        """Builds the lookup tables between user form and command form and the set command template"""
+        # key: normalized user form value, value: command form value
+        self._to_command = dict()
+        # key: stripped command (or user) form value, value: user form value
+        self._to_user = dict()
+
+        if self.data_type == 'BOOLEAN':
+            self._to_command = {'TRUE': self.str_true, self.str_true.upper(): self.str_true,
+                                'FALSE': self.str_false, self.str_false.upper(): self.str_false}
+            self._to_user = {self.str_true.upper(): True, self.str_true.strip(): True, str(True): True,
+                             self.str_false.upper(): False, self.str_false.strip(): False, str(False): False}
+
+        elif self.data_type == 'COMBO' and self.combo_cmd:
+            # a state name wins over an equal command value, the first matching state wins when converting back
+            self._to_command = {cmd.strip(): cmd.strip() for cmd in self.combo_cmd.values()}
+            self._to_command.update({key.strip(): cmd for key, cmd in self.combo_cmd.items()})
+            for key, cmd in self.combo_cmd.items():
+                self._to_user.setdefault(key.strip(), key)
+                self._to_user.setdefault(cmd.strip(), key)
+
+        # the value replaces every <*> in set_cmd, or is appended after a space
+        if '<*>' in self.set_cmd:
+            self._set_cmd_parts = tuple(self.set_cmd.split('<*>'))
+        else:
+            self._set_cmd_parts = (self.set_cmd + ' ', '')
+
+        self._format_value = str
+        if self.data_type == 'DOUBLE' and self.str_value_out:
+            # the schema default '%.9e%' carries a stray '%', drop it instead of failing on every set
+            for value_format in (self.str_value_out, self.str_value_out.rstrip('%')):
+                try:
+                    value_format % 1.0
+                except (TypeError, ValueError):
+                    continue
+                self._format_value = lambda value, value_format=value_format: _format_double(value, value_format)
+                break
+            else:
+                self._logger.warning(f"Invalid str_value_out '{self.str_value_out}' for quantity '{self.name}', "
+                                     f"values are sent unformatted.")
+
+    def _run_async(self, fn: Callable, *args) -> asyncio.Future:
+        """Runs fn on the I/O worker of the instrument (or a default executor thread) and returns an awaitable"""
+        if self._submit_method:
+            return asyncio.wrap_future(self._submit_method(fn, *args))
+        return asyncio.get_running_loop().run_in_executor(None, fn, *args)
     # endregion
@@ -2,13 +2,14 @@ import sys
 import os
 from http import HTTPStatus
 
-import requests
 import logging
 import threading
 from PyQt6.QtCore import *
 from PyQt6.QtWidgets import *
 from PyQt6.QtGui import *
 from DB import db
+from Instrument.latest_value_store import get_latest_value_store
+from Instrument.instrument_server_client import get_instrument_server_client
 from instrument_connection_service import InstrumentConnectionService, AlreadyConnectedError
 from InstrumentDetection.instrument_detection_service import InstrumentDetectionService
 from GUI.experimentWindowGui import ExperimentWindowGui
@@ -446,10 +447,16 @@ class InstrumentServerWindow(QMainWindow):
                 event.ignore()
                 return
 
+        # Persist the latest values of all quantities before the server goes down
+        try:
+            get_latest_value_store().close()
+        except Exception as e:
+            self.get_logger().fatal(f'There was a problem persisting latest values: {e}')
+
         # Accept shutdown and call endpoint
         event.accept()
-        url = r'http://127.0.0.1:5000/shutDown'
-        requests.get(url)
+        # the server exits while answering, never repeat this request
+        get_instrument_server_client().get('/shutDown', retry=False)
 
     def add_instrument_to_list(self, model: str, cute_name: str, address: str) -> None:
         newItem = QTreeWidgetItem(self.instrument_tree, [model, cute_name, address])
@@ -474,8 +481,7 @@ class InstrumentServerWindow(QMainWindow):
 
         response = HTTPStatus.OK
         try:
-            url = r'http://127.0.0.1:5000/serverStatus/isRunning'
-            response = requests.get(url)
+            response = get_instrument_server_client().get('/serverStatus/isRunning')
 
         except Exception as ex:
             self.get_logger().critical('Could not check if Instrument Server is running!')
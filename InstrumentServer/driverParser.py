@@ -3,7 +3,6 @@ from msilib.schema import Error
 import platform
 import logging
 from flask import request, redirect, url_for
-from configparser import RawConfigParser
 from flask import (Blueprint, jsonify)
 from werkzeug.exceptions import (abort, BadRequestKeyError)
 
@@ -24,16 +23,7 @@ def parseDriver():
     try:
         global ini_path
         ini_path = request.get_json()
-
-        config = RawConfigParser()
-        config.read(ini_path)
-        gen_settings = dps.getGenSettings(dict(config['General settings']), ini_path)
-        model_options = dps.getModelOptions(dict(config['Model and options']))
-        visa_settings = dps.getVISASettings(dict(config['VISA settings']))
-        quantities = dps.getQuantities({key: value for key, value in config._sections.items() \
-                                        if key not in ('General settings', 'Model and options', 'VISA settings')})
-        return jsonify({'general_settings': gen_settings, 'model_and_options': model_options, 'visa': visa_settings,
-                        'quantities': quantities}), 200
+        return jsonify(dps.parseDriverFile(ini_path)), 200
 
     except Exception as e:
         my_logger.error(e.args)
@@ -45,15 +35,7 @@ def addDriver():
     try:
         global ini_path
         ini_path = request.form['driverPath']
-        
-        config = RawConfigParser()
-        config.read(ini_path)
-        gen_settings = dps.getGenSettings(dict(config['General settings']), ini_path)
-        model_options = dps.getModelOptions(dict(config['Model and options']))
-        visa_settings = dps.getVISASettings(dict(config['VISA settings']))
-        quantities = dps.getQuantities({key: value for key, value in config._sections.items()\
-                if key not in ('General settings', 'Model and options', 'VISA settings')})
-        return {'general_settings': gen_settings, 'model_and_options': model_options, 'visa': visa_settings, 'quantities': quantities}, 200
+        return dps.parseDriverFile(ini_path), 200
         
     except Exception as e:
         my_logger.error(e.args)
@@ -1,4 +1,15 @@
 import os
+import re
+import copy
+import threading
+from collections import OrderedDict
+from configparser import RawConfigParser
+
+# Parsed drivers, key: (absolute ini path, file size, mtime), value: normalized driver dictionary
+# The least recently used driver is evicted once more than DRIVER_CACHE_SIZE drivers are cached
+DRIVER_CACHE_SIZE = 32
+_driver_cache = OrderedDict()
+_driver_cache_lock = threading.Lock()
 
 '''
     Takes dictionary of just section ['General settings'] and the path of the .ini driver
@@ -250,6 +261,41 @@ def getVISASettings(settings: dict) -> dict:
     else:
         tcpip_port = None
 
+    if 'coalesce_commands' in settings:
+        coalesce_commands = _toBool(settings['coalesce_commands'])
+    else:
+        coalesce_commands = True
+
+    if 'max_message_length' in settings:
+        max_message_length = int(settings['max_message_length'])
+        if max_message_length <= 0:
+            raise ValueError(f"Invalid value '{max_message_length}' for [VISA settings].max_message_length")
+    else:
+        max_message_length = 256
+
+    if 'suppress_redundant_writes' in settings:
+        suppress_redundant_writes = _toBool(settings['suppress_redundant_writes'])
+    else:
+        suppress_redundant_writes = True
+
+    # hardware list mode: list_arm_cmd makes the instrument wait for list_trigger_cmd to step to the next point
+    if 'list_arm_cmd' in settings:
+        list_arm_cmd = settings['list_arm_cmd']
+    else:
+        list_arm_cmd = None
+
+    if 'list_trigger_cmd' in settings:
+        list_trigger_cmd = settings['list_trigger_cmd']
+    else:
+        list_trigger_cmd = None
+
+    if 'list_max_points' in settings:
+        list_max_points = int(settings['list_max_points'])
+        if list_max_points <= 0:
+            raise ValueError(f"Invalid value '{list_max_points}' for [VISA settings].list_max_points")
+    else:
+        list_max_points = None
+
     if tcpip_specify_port and not (tcpip_port is None or not tcpip_port):
         raise ValueError(f'[VISA settings].tcpip_port must be specified when [VISA settings].tcpip_specify_port is true')
 
@@ -277,6 +323,12 @@ def getVISASettings(settings: dict) -> dict:
         'gpib_board': gpib_board,
         'gpib_go_to_local': gpib_go_to_local,
         'tcpip_specify_port': tcpip_specify_port,
+        'coalesce_commands': coalesce_commands,
+        'max_message_length': max_message_length,
+        'suppress_redundant_writes': suppress_redundant_writes,
+        'list_arm_cmd': list_arm_cmd,
+        'list_trigger_cmd': list_trigger_cmd,
+        'list_max_points': list_max_points,
     }
 
 '''
@@ -339,6 +391,21 @@ def getQuantities(settings: dict) -> dict:
         else:
             x_unit = None
 
+        # vector_dtype is only valid for vectors: NumPy dtype of the binary block the instrument sends, e.g. '>f4'
+        # VECTOR_COMPLEX data is sent as interleaved real and imaginary parts
+        if 'vector_dtype' in quantity and datatype in ('VECTOR', 'VECTOR_COMPLEX'):
+            vector_dtype = quantity['vector_dtype'].strip()
+            if not re.fullmatch(r'[<>=]?(f[248]|i[1248]|u[1248])', vector_dtype):
+                raise ValueError(f"Invalid value '{vector_dtype}' for [{key}].vector_dtype")
+        else:
+            vector_dtype = None
+
+        # overrides [VISA settings].suppress_redundant_writes, None inherits it
+        if 'suppress_redundant_writes' in quantity:
+            suppress_redundant_writes = _toBool(quantity['suppress_redundant_writes'])
+        else:
+            suppress_redundant_writes = None
+
         # combo data type must have 'combo_def's in quantity
         combos = [value for key, value in quantity.items() if 'combo_def_' in key]
         if datatype == 'COMBO':
@@ -394,6 +461,12 @@ def getQuantities(settings: dict) -> dict:
         else:
             get_cmd = None
 
+        # uploads all points of a sweep for hardware list mode, <*> is replaced by the comma separated values
+        if 'list_cmd' in quantity and set_cmd:
+            list_cmd = quantity['list_cmd']
+        else:
+            list_cmd = None
+
         # combo data type must have 'combo_def's in quantity
         cmds = [value for key, value in quantity.items() if 'cmd_def_' in key]
         if datatype == 'COMBO':
@@ -422,6 +495,7 @@ def getQuantities(settings: dict) -> dict:
             'high_lim': high_lim,
             'x_name': x_name,
             'x_unit': x_unit,
+            'vector_dtype': vector_dtype,
             'groupname': group,
             'section': section,
             'state_quant': state_quant,
@@ -432,7 +506,66 @@ def getQuantities(settings: dict) -> dict:
             'show_in_measurement_dlg': show_in_measurement_dlg,
             'set_cmd': set_cmd,
             'get_cmd': get_cmd,
-            'combo_cmd': combo_cmd
+            'combo_cmd': combo_cmd,
+            'suppress_redundant_writes': suppress_redundant_writes,
+            'list_cmd': list_cmd
         }
     
-    return quantities
\ No newline at end of file
+    return quantities
+
+
+def _toBool(value) -> bool:
+    """Converts an ini value such as 'True', 'false', '1' or 'no' to bool"""
+    value = str(value).strip().lower()
+    if value in ('true', '1', 'yes', 'on'):
+        return True
+    if value in ('false', '0', 'no', 'off'):
+        return False
+    raise ValueError(f"'{value}' is not a valid boolean value")
+
+
+'''
+    Takes the path of an .ini driver
+    Returns dictionary of the normalized driver contents with keys 'general_settings', 'model_and_options', 'visa' and 'quantities'
+    Unchanged files (same size and mtime) are served from the parsed driver cache
+'''
+def parseDriverFile(ini_path) -> dict:
+    # RawConfigParser silently skips files it can not open
+    if not os.path.isfile(ini_path):
+        raise FileNotFoundError(f'Driver {ini_path} does not exist.')
+
+    stat = os.stat(ini_path)
+    key = (os.path.abspath(ini_path), stat.st_size, stat.st_mtime_ns)
+
+    with _driver_cache_lock:
+        if key in _driver_cache:
+            _driver_cache.move_to_end(key)
+            # callers may modify the driver (e.g. baud rate), never hand out the cached one
+            driver = copy.deepcopy(_driver_cache[key])
+            # the same file may have been given by another (relative) path
+            driver['general_settings']['ini_path'] = ini_path.replace('/', os.sep)
+            return driver
+
+    driver = _parseDriverFile(ini_path)
+
+    with _driver_cache_lock:
+        # older versions of the same file can never be hit again
+        for stale_key in [cached_key for cached_key in _driver_cache if cached_key[0] == key[0]]:
+            del _driver_cache[stale_key]
+        _driver_cache[key] = driver
+        while len(_driver_cache) > DRIVER_CACHE_SIZE:
+            _driver_cache.popitem(last=False)
+
+    return copy.deepcopy(driver)
+
+
+def _parseDriverFile(ini_path) -> dict:
+    config = RawConfigParser()
+    config.read(ini_path)
+    gen_settings = getGenSettings(dict(config['General settings']), ini_path)
+    model_options = getModelOptions(dict(config['Model and options']))
+    visa_settings = getVISASettings(dict(config['VISA settings']))
+    quantities = getQuantities({key: value for key, value in config._sections.items() \
+                                if key not in ('General settings', 'Model and options', 'VISA settings')})
+    return {'general_settings': gen_settings, 'model_and_options': model_options, 'visa': visa_settings,
+            'quantities': quantities}
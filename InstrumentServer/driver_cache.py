@@ -0,0 +1,57 @@
+import hashlib
+import threading
+
+
+###################################################################################
+# DriverDocumentCache
+###################################################################################
+class DriverDocumentCache:
+    """Serialized driver documents returned by /instrumentDB/getInstrument, keyed by cute_name.
+    Every entry carries an ETag so clients can skip the transfer when the driver did not change.
+    Entries must be invalidated whenever the driver of the instrument changes, latest values are not cached.
+    """
+
+    def __init__(self):
+        # key: cute_name, value: (etag, JSON body)
+        self._documents = dict()
+        # key: cute_name, value: number of invalidations, guards against caching a document read before an update
+        self._generations = dict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, cute_name: str):
+        """Returns (etag, body) of the cached document or None"""
+        with self._lock:
+            cached = self._documents.get(cute_name)
+            if cached is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return cached
+
+    def generation(self, cute_name: str) -> int:
+        """Returns the current generation of the entry, to be passed to put()"""
+        with self._lock:
+            return self._generations.get(cute_name, 0)
+
+    def put(self, cute_name: str, body: str, generation: int):
+        """Caches the serialized document unless the instrument was invalidated since generation was read
+        Returns:
+            (etag, body)
+        """
+        etag = hashlib.sha1(body.encode()).hexdigest()
+        with self._lock:
+            if self._generations.get(cute_name, 0) == generation:
+                self._documents[cute_name] = (etag, body)
+        return etag, body
+
+    def invalidate(self, cute_name: str = None):
+        """Drops the cached document of an instrument, or of all instruments if no cute_name is given"""
+        with self._lock:
+            cute_names = list(self._documents.keys()) if cute_name is None else [cute_name]
+            if cute_name is None:
+                cute_names += list(self._generations.keys())
+            for name in cute_names:
+                self._documents.pop(name, None)
+                self._generations[name] = self._generations.get(name, 0) + 1
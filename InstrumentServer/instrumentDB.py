@@ -1,10 +1,10 @@
 import logging
 from flask import request
 from psycopg2 import errors
-import requests
-from flask import Blueprint, jsonify
+from flask import Blueprint, current_app, json, jsonify
 from werkzeug.exceptions import (BadRequestKeyError)
 import instrumentDBService as ids
+import driverParserService as dps
 from DB import db
 from http import HTTPStatus
 
@@ -15,36 +15,47 @@ def setLogger(logger: logging.Logger):
     global my_logger 
     my_logger = logger
 
+def setLatestValueWriter(writer):
+    global latest_value_writer
+    latest_value_writer = writer
+
+def setDriverCache(cache):
+    global driver_cache
+    driver_cache = cache
+
 ''' Adds instrument details to the database '''
 @bp.route('/addInstrument', methods=['GET', 'POST'])
 def addInstrument():
     try:        
         details = request.get_json()
-        url = r'http://127.0.0.1:5000/driverParser/'
-        instrument_details = requests.post(url, json=details['path'])
-        if HTTPStatus.MULTIPLE_CHOICES > instrument_details.status_code <= HTTPStatus.OK:
-            connection = db.get_db()
-            cute_name = details['cute_name']
-            instrument_details = instrument_details.json()
-            manufacturer = instrument_details['general_settings']['name']
-            
-            ids.addInstrumentInterface(connection, details, manufacturer)
-            ids.addGenSettings(connection, instrument_details['general_settings'], cute_name)
-            ids.addModelOptions(connection, instrument_details['model_and_options'], cute_name)
-            ids.addVisaSettings(connection, instrument_details['visa'], cute_name)
-            for quantity in instrument_details['quantities'].keys():
-                ids.addQuantity(connection, instrument_details['quantities'][quantity], cute_name)
-            connection.commit()
-
-            # If the baud rate is provided, we will overwrite the value we got from the ini file
-            if details['baud_rate']:
-                my_logger.info(f"Baud Rate: {details['baud_rate']} was provided. Replacing value from ini file.")
-                ids.update_visa_baud_rate(connection, cute_name, details['baud_rate'])
 
-            db.close_db(connection)
-            return jsonify(f"Instrument: \"{details['cute_name']}\" was (re)added!"), HTTPStatus.OK
-        else:
+        # parsed in-process, the /driverParser/ route is only a wrapper for external clients
+        try:
+            instrument_details = dps.parseDriverFile(details['path'])
+        except Exception as e:
+            my_logger.error(e.args)
             raise FileNotFoundError
+
+        connection = db.get_db()
+        cute_name = details['cute_name']
+        manufacturer = instrument_details['general_settings']['name']
+        
+        # If the baud rate is provided, we will overwrite the value we got from the ini file
+        if details['baud_rate']:
+            my_logger.info(f"Baud Rate: {details['baud_rate']} was provided. Replacing value from ini file.")
+            instrument_details['visa']['baud_rate'] = details['baud_rate']
+
+        # All rows of the driver are added in one transaction, quantities with a single multi-row insert
+        ids.addInstrumentInterface(connection, details, manufacturer)
+        ids.addGenSettings(connection, instrument_details['general_settings'], cute_name)
+        ids.addModelOptions(connection, instrument_details['model_and_options'], cute_name)
+        ids.addVisaSettings(connection, instrument_details['visa'], cute_name)
+        ids.addQuantities(connection, instrument_details['quantities'], cute_name)
+        connection.commit()
+        driver_cache.invalidate(cute_name)
+
+        db.close_db(connection)
+        return jsonify(f"Instrument: \"{details['cute_name']}\" was (re)added!"), HTTPStatus.OK
         
     except FileNotFoundError:
         my_logger.error("Invalid driver path.")
@@ -86,19 +97,25 @@ def allInstruments():
         return jsonify(Exception.args), HTTPStatus.BAD_REQUEST
 
 
+''' Returns the driver of an instrument. Served from the driver cache, supports If-None-Match '''
 @bp.route('/getInstrument')
 def getInstrument():
     try:
         instrument_name = request.args['cute_name']        
-        connection = db.get_db()
-        instrument_interface = ids.getInstrumentInterface(connection, instrument_name)
-        general_settings = ids.getGenSettings(connection, instrument_name)
-        model_options = ids.getModelOptions(connection, instrument_name)
-        visa_settings = ids.getVisaSettings(connection, instrument_name)
-        quantities = ids.getQuantities(connection, instrument_name)
+        cached_document = driver_cache.get(instrument_name)
 
-        db.close_db(connection)
-        return jsonify({'instrument_interface' : instrument_interface, 'general_settings' : general_settings, 'model_and_options' : model_options, 'visa' : visa_settings, 'quantities' : quantities}), HTTPStatus.OK
+        if cached_document is None:
+            generation = driver_cache.generation(instrument_name)
+            connection = db.get_db()
+            instrument_document = ids.getInstrumentDocument(connection, instrument_name)
+            db.close_db(connection)
+            cached_document = driver_cache.put(instrument_name, json.dumps(instrument_document), generation)
+
+        etag, body = cached_document
+        response = current_app.response_class(body, status=HTTPStatus.OK, mimetype='application/json')
+        response.set_etag(etag)
+        # answers 304 Not Modified without a body if the client already has this version
+        return response.make_conditional(request)
 
     except BadRequestKeyError:
         my_logger.error('Invalid instrument name.')
@@ -135,9 +152,13 @@ def getLatestValue():
     try:
         instrument_name = request.args['cute_name']
         label = request.args['label']
-        connection = db.get_db()
-        latest_value = ids.getLatestValue(connection, instrument_name, label)
-        db.close_db(connection)
+
+        # values waiting in the write-behind queue are newer than the database
+        is_pending, latest_value = latest_value_writer.get_pending(instrument_name, label)
+        if not is_pending:
+            connection = db.get_db()
+            latest_value = ids.getLatestValue(connection, instrument_name, label)
+            db.close_db(connection)
         return jsonify({'latest_value': latest_value}), HTTPStatus.OK
 
     except BadRequestKeyError:
@@ -157,9 +178,9 @@ def setLatestValue():
         instrument_name = request.args['cute_name']
         label = request.args['label']
         latest_value = request.args['latest_value']
-        connection = db.get_db()
-        ids.setLatestValue(connection, latest_value, instrument_name, label)
-        db.close_db(connection)
+
+        # written to the database in batches by the LatestValueWriter
+        latest_value_writer.put(instrument_name, label, latest_value)
         return jsonify("Instrument's latest value on {label} updated.".format(label=label)), HTTPStatus.OK
 
     except BadRequestKeyError:
@@ -169,14 +190,82 @@ def setLatestValue():
     except Exception:
         my_logger.error(Exception.args)
         return jsonify(Exception.args), HTTPStatus.BAD_REQUEST
+
+
+''' Returns latest values of many labels: [[cute_name, label], ...] -> {cute_name: {label: latest_value}} '''
+@bp.route('/getLatestValues', methods = ['GET', 'POST'])
+def getLatestValues():
+    try:
+        quantities = [(str(quantity[0]), str(quantity[1])) for quantity in request.get_json()]
+
+        # values waiting in the write-behind queue are newer than the database
+        latest_values, missing = {}, []
+        for cute_name, label in quantities:
+            is_pending, latest_value = latest_value_writer.get_pending(cute_name, label)
+            if is_pending:
+                latest_values[(cute_name, label)] = latest_value
+            else:
+                missing.append((cute_name, label))
+
+        if missing:
+            connection = db.get_db()
+            latest_values.update(ids.getLatestValues(connection, missing))
+            db.close_db(connection)
+
+        result = {}
+        for (cute_name, label), latest_value in latest_values.items():
+            result.setdefault(cute_name, {})[label] = latest_value
+        return jsonify(result), HTTPStatus.OK
+
+    except (TypeError, IndexError):
+        my_logger.error('Expected a list of [cute_name, label] pairs.')
+        return jsonify('Expected a list of [cute_name, label] pairs.'), HTTPStatus.BAD_REQUEST
+
+    except Exception:
+        my_logger.error(Exception.args)
+        return jsonify(Exception.args), HTTPStatus.BAD_REQUEST
+
+
+''' Sets latest values of many labels: [[cute_name, label, latest_value], ...] '''
+@bp.route('/setLatestValues', methods = ['PUT'])
+def setLatestValues():
+    try:
+        latest_values = {(str(quantity[0]), str(quantity[1])): quantity[2] for quantity in request.get_json()}
+
+        # written to the database in one transaction by the LatestValueWriter
+        latest_value_writer.put_many(latest_values)
+        return jsonify(f"{len(latest_values)} latest value(s) updated."), HTTPStatus.OK
+
+    except (TypeError, IndexError):
+        my_logger.error('Expected a list of [cute_name, label, latest_value] entries.')
+        return jsonify('Expected a list of [cute_name, label, latest_value] entries.'), HTTPStatus.BAD_REQUEST
+
+    except Exception:
+        my_logger.error(Exception.args)
+        return jsonify(Exception.args), HTTPStatus.BAD_REQUEST
+
+
+''' Returns hit and miss counts of the driver cache '''
+@bp.route('/driverCacheStats')
+def driverCacheStats():
+    return jsonify({'hits': driver_cache.hits, 'misses': driver_cache.misses}), HTTPStatus.OK
+
+
+''' Returns queue depth and flush latency of the latest value write-behind queue '''
+@bp.route('/latestValueWriterStats')
+def latestValueWriterStats():
+    return jsonify(latest_value_writer.stats), HTTPStatus.OK
+
     
 @bp.route('/removeInstrument')
 def removeInstrument():
     try:
         instrument_name = request.args['cute_name']        
+        latest_value_writer.discard(instrument_name)
         connection = db.get_db()
         ids.deleteInstrument(connection, instrument_name)
         db.close_db(connection)
+        driver_cache.invalidate(instrument_name)
         return jsonify('Instrument removed.'), HTTPStatus.OK
     
     except BadRequestKeyError:
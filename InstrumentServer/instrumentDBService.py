@@ -1,22 +1,52 @@
 import json
 import psycopg2
 from psycopg2.extensions import AsIs
+from psycopg2.extras import execute_values
+from DB import db
+
+# Column names of every table, key: table name, value: tuple of column names in table order
+# Filled from information_schema once and reloaded when the schema is (re)applied by db.init_db
+_table_columns = {}
+_table_columns_schema_version = None
+
+
+def loadTableColumns(connection):
+    """Reads the columns of all tables with one catalog query and caches them"""
+    global _table_columns, _table_columns_schema_version
+
+    schema_version = db.get_schema_version()
+    table_columns = {}
+    with connection.cursor() as cursor:
+        column_names_query = "SELECT table_name, column_name FROM information_schema.columns " \
+                             "WHERE table_schema = current_schema() ORDER BY table_name, ordinal_position;"
+        cursor.execute(column_names_query)
+        for table_name, column_name in cursor.fetchall():
+            table_columns.setdefault(table_name, []).append(column_name)
+
+    _table_columns = {table_name: tuple(column_names) for table_name, column_names in table_columns.items()}
+    _table_columns_schema_version = schema_version
+
+
+def getTableColumns(connection, table: str) -> tuple:
+    """Returns the column names of a table from the schema cache"""
+    if _table_columns_schema_version != db.get_schema_version() or table not in _table_columns:
+        loadTableColumns(connection)
+    return _table_columns[table]
+
 
 def addInstrumentInterface(connection, ins_interface: dict, manufacturer):
 
     table = 'instruments'
     with connection.cursor() as cursor:
 
-        column_names_query = "SELECT DISTINCT column_name FROM information_schema.columns WHERE table_name = '{table_name}';".format(table_name=table)           
-        cursor.execute(column_names_query)
-        column_names = cursor.fetchall()
+        column_names = getTableColumns(connection, table)
         columns, values = [], []
         
         for column_name in column_names:
-            if column_name[0] in ins_interface.keys():
-                if ins_interface[column_name[0]]:
-                    columns.append(column_name[0])
-                    values.append(ins_interface[column_name[0]])
+            if column_name in ins_interface.keys():
+                if ins_interface[column_name]:
+                    columns.append(column_name)
+                    values.append(ins_interface[column_name])
 
         columns.append('manufacturer')
         values.append(manufacturer) 
@@ -31,16 +61,14 @@ def addGenSettings(connection, gen_settings: dict, cute_name):
 
     with connection.cursor() as cursor:
 
-        column_names_query = "SELECT DISTINCT column_name FROM information_schema.columns WHERE table_name = '{table_name}';".format(table_name=table)           
-        cursor.execute(column_names_query)
-        column_names = cursor.fetchall()
+        column_names = getTableColumns(connection, table)
         columns, values = [], []
 
         for column_name in column_names:
-            if column_name[0] in gen_settings.keys():
-                if gen_settings[column_name[0]]:
-                    columns.append(column_name[0])
-                    values.append(gen_settings[column_name[0]])
+            if column_name in gen_settings.keys():
+                if gen_settings[column_name]:
+                    columns.append(column_name)
+                    values.append(gen_settings[column_name])
        
         columns.append('cute_name')
         values.append(cute_name)        
@@ -53,30 +81,28 @@ def addModelOptions(connection, model_options: dict, cute_name):
     table = 'model_and_options'
     with connection.cursor() as cursor:
 
-        column_names_query = "SELECT DISTINCT column_name FROM information_schema.columns WHERE table_name = '{table_name}';".format(table_name=table)           
-        cursor.execute(column_names_query)
-        column_names = cursor.fetchall()
+        column_names = getTableColumns(connection, table)
         columns, values = [], []
 
         for column_name in column_names:
-            if column_name[0] in model_options.keys():
-                if column_name[0] == 'models':
+            if column_name in model_options.keys():
+                if column_name == 'models':
                     columns.append('models')
                     models = '{' + ','.join(model_options['models'].keys()) + '}'
                     values.append(models)
                     columns.append('model_ids')
                     model_ids = '{' + ','.join(model_options['models'].values()) + '}'
                     values.append(model_ids)
-                elif column_name[0] == 'options':
+                elif column_name == 'options':
                     columns.append('options')
                     options = '{' + ','.join(model_options['options'].keys()) + '}'
                     values.append(options)
                     columns.append('option_ids')
                     option_ids = '{' + ','.join(model_options['options'].values()) + '}'
                     values.append(option_ids)
-                elif model_options[column_name[0]]:
-                    columns.append(column_name[0])
-                    values.append(model_options[column_name[0]])
+                elif model_options[column_name]:
+                    columns.append(column_name)
+                    values.append(model_options[column_name])
 
         columns.append('cute_name')
         values.append(cute_name)         
@@ -89,73 +115,76 @@ def addVisaSettings(connection, visa_settings: dict, cute_name):
     table = 'visa'
     with connection.cursor() as cursor:
 
-        column_names_query = "SELECT DISTINCT column_name FROM information_schema.columns WHERE table_name = '{table_name}';".format(table_name=table)           
-        cursor.execute(column_names_query)
-        column_names = cursor.fetchall()
+        column_names = getTableColumns(connection, table)
         columns, values = [], []
 
         for column_name in column_names:
-            if column_name[0] in visa_settings.keys():
-                if visa_settings[column_name[0]]:
-                    columns.append(column_name[0])
-                    values.append(visa_settings[column_name[0]])
+            if column_name in visa_settings.keys():
+                # False is stored explicitly, the column default may be true (e.g. coalesce_commands)
+                if visa_settings[column_name] or visa_settings[column_name] is False:
+                    columns.append(column_name)
+                    values.append(visa_settings[column_name])
 
         columns.append('cute_name')
         values.append(cute_name)         
         insert_statement = cursor.mogrify("INSERT INTO %s (%s) VALUES %s;", (AsIs(table), AsIs(','.join(columns)), tuple(values)))
         cursor.execute(insert_statement)
 
+def _quantityColumnValue(quantity: dict, column_name: str):
+    """Returns the database value of a quantity column, None if the column default should be used"""
+    if column_name in ('state_values', 'model_values', 'option_values'):
+        return '{' + ','.join(quantity[column_name]) + '}'
+
+    elif column_name == 'combo_cmd':
+        return json.dumps(quantity['combo_cmd'])
+
+    # a quantity without set_cmd and get_cmd can not be read, the column default would turn it into 'set_cmd?'
+    elif column_name == 'get_cmd' and quantity['get_cmd'] is None:
+        return AsIs('NULL')
+
+    # False is stored explicitly, NULL means the quantity inherits the VISA setting (e.g. suppress_redundant_writes)
+    elif quantity[column_name] or quantity[column_name] is False:
+        return quantity[column_name]
+
+    return None
+
 def addQuantity(connection, quantity: dict, cute_name):
+    addQuantities(connection, {quantity['label']: quantity}, cute_name)
+
+def addQuantities(connection, quantities: dict, cute_name):
+    """Inserts all quantities of an instrument with a single multi-row INSERT. Does not commit."""
+    if not quantities:
+        return
 
     table = 'quantities'
+    default = AsIs('DEFAULT')
     with connection.cursor() as cursor:
 
-        column_names_query = "SELECT DISTINCT column_name FROM information_schema.columns WHERE table_name = '{table_name}';".format(table_name=table)           
-        cursor.execute(column_names_query)
-        column_names = cursor.fetchall()
-        columns, values = [], []
-        
-        for column_name in column_names:
-            if column_name[0] in quantity.keys():             
-                if column_name[0] == 'state_values':
-                    columns.append('state_values')
-                    state_values = '{' + ','.join(quantity['state_values']) + '}'
-                    values.append(state_values)
-                
-                elif column_name[0] == 'model_values':
-                    columns.append('model_values')
-                    model_values = '{' + ','.join(quantity['model_values']) + '}'
-                    values.append(model_values)
-                    
-                elif column_name[0] == 'option_values':
-                    columns.append('option_values')
-                    option_values = '{' + ','.join(quantity['option_values']) + '}'
-                    values.append(option_values)
-
-                elif column_name[0] == 'combo_cmd':
-                    columns.append('combo_cmd')
-                    combo_cmd = json.dumps(quantity['combo_cmd'])
-                    values.append(combo_cmd)
-
-
-                elif quantity[column_name[0]]:
-                    columns.append(column_name[0])
-                    values.append(quantity[column_name[0]])
-
+        # every row needs the same columns, use DEFAULT where a quantity does not define a value
+        columns = [column_name for column_name in getTableColumns(connection, table)
+                   if column_name not in ('cute_name', 'position') and any(column_name in quantity for quantity in quantities.values())]
+        rows = []
+        for position, quantity in enumerate(quantities.values()):
+            row = []
+            for column_name in columns:
+                value = _quantityColumnValue(quantity, column_name) if column_name in quantity else None
+                row.append(default if value is None else value)
+            # quantities are read back in the order of the driver
+            row.append(position)
+            row.append(cute_name)
+            rows.append(tuple(row))
+
+        columns.append('position')
         columns.append('cute_name')
-        values.append(cute_name)         
-        insert_statement = cursor.mogrify("INSERT INTO %s (%s) VALUES %s;", (AsIs(table), AsIs(','.join(columns)), tuple(values)))        
-        cursor.execute(insert_statement)
+        insert_statement = cursor.mogrify("INSERT INTO %s (%s) VALUES ", (AsIs(table), AsIs(','.join(columns)))).decode()
+        execute_values(cursor, insert_statement + "%s;", rows, page_size=len(rows))
 
 def getInstrumentInterface(connection: object, instrument_name: str) -> dict:
 
     table = 'instruments'
     general_settings = {}
     with connection.cursor() as cursor:
-        column_names_query = "SELECT DISTINCT column_name FROM information_schema.columns WHERE table_name = '{table_name}';".format(table_name=table)            
-        cursor.execute(column_names_query)
-        column_names = cursor.fetchall()
-        column_names = tuple(column_name[0] for column_name in column_names)
+        column_names = getTableColumns(connection, table)
         
         get_instrument_query = cursor.mogrify("SELECT %s FROM %s WHERE cute_name = %s;", (AsIs(','.join(column_names)), AsIs(table), instrument_name))
         cursor.execute(get_instrument_query)
@@ -169,10 +198,7 @@ def getGenSettings(connection: object, instrument_name: str) -> dict:
     table = 'general_settings'
     general_settings = {}
     with connection.cursor() as cursor:
-        column_names_query = "SELECT DISTINCT column_name FROM information_schema.columns WHERE table_name = '{table_name}';".format(table_name=table)            
-        cursor.execute(column_names_query)
-        column_names = cursor.fetchall()
-        column_names = tuple(column_name[0] for column_name in column_names)
+        column_names = getTableColumns(connection, table)
         
         get_instrument_query = cursor.mogrify("SELECT %s FROM %s WHERE cute_name = %s;", (AsIs(','.join(column_names)), AsIs(table), instrument_name))
         cursor.execute(get_instrument_query)
@@ -188,10 +214,7 @@ def getModelOptions(connection: object, instrument_name: str) -> dict:
     model_options = {}
 
     with connection.cursor() as cursor:
-        column_names_query = "SELECT DISTINCT column_name FROM information_schema.columns WHERE table_name = '{table_name}';".format(table_name=table)            
-        cursor.execute(column_names_query)
-        column_names = cursor.fetchall()
-        column_names = tuple(column_name[0] for column_name in column_names)
+        column_names = getTableColumns(connection, table)
 
         get_instrument_query = cursor.mogrify("SELECT %s FROM %s WHERE cute_name = %s;", (AsIs(','.join(column_names)), AsIs(table), instrument_name))
         cursor.execute(get_instrument_query)
@@ -208,10 +231,7 @@ def getVisaSettings(connection: object, instrument_name: str) -> dict:
     table = 'visa'
     visa_settings = {}
     with connection.cursor() as cursor:
-        column_names_query = "SELECT DISTINCT column_name FROM information_schema.columns WHERE table_name = '{table_name}';".format(table_name=table)            
-        cursor.execute(column_names_query)
-        column_names = cursor.fetchall()
-        column_names = tuple(column_name[0] for column_name in column_names)
+        column_names = getTableColumns(connection, table)
         
         get_instrument_query = cursor.mogrify("SELECT %s FROM %s WHERE cute_name = %s;", (AsIs(','.join(column_names)), AsIs(table), instrument_name))
         cursor.execute(get_instrument_query)
@@ -226,36 +246,73 @@ def getQuantities(connection: object, instrument_name: str) -> dict:
     table = 'quantities'
     quantities = {}
     with connection.cursor() as cursor:
-        column_names_query = "SELECT DISTINCT column_name FROM information_schema.columns WHERE table_name = '{table_name}';".format(table_name=table)            
-        cursor.execute(column_names_query)
-        column_names = cursor.fetchall()
-        column_names = tuple(column_name[0] for column_name in column_names)
+        column_names = getTableColumns(connection, table)
 
-        get_quantity_names_query = "SELECT {column} FROM {table_name} WHERE cute_name = '{cute_name}';".format(column='label', table_name=table, cute_name=instrument_name)
-        cursor.execute(get_quantity_names_query)
-        quantity_names = cursor.fetchall()
+        # all quantities of the instrument in one query, in driver order
+        get_quantities_query = cursor.mogrify("SELECT %s FROM %s WHERE cute_name = %s ORDER BY position NULLS LAST, label;", (AsIs(','.join(column_names)), AsIs(table), instrument_name))
+        cursor.execute(get_quantities_query)
 
-        for quantity in quantity_names:
-            get_quantity_query = cursor.mogrify("SELECT %s FROM %s WHERE cute_name = %s AND label = %s;", (AsIs(','.join(column_names)), AsIs(table), instrument_name, quantity[0]))
-            cursor.execute(get_quantity_query)
-            result = cursor.fetchmany()
-            quantities[quantity[0]] = {key : value for key, value in zip(column_names, result[0])}
+        for result in cursor.fetchall():
+            quantity = {key : value for key, value in zip(column_names, result)}
+            quantities[quantity['label']] = quantity
 
     return quantities
 
 
+def getInstrumentDocument(connection: object, instrument_name: str) -> dict:
+    """Returns the whole driver of an instrument with a single query, in the layout used by InstrumentManager:
+        {'instrument_interface', 'general_settings', 'model_and_options', 'visa', 'quantities'}
+    The latest values change during every experiment, they are left out so the document can be cached.
+    """
+    query = """
+        SELECT row_to_json(i), row_to_json(gs), row_to_json(mo), row_to_json(v),
+               (SELECT COALESCE(json_object_agg(q.label, to_jsonb(q) - 'latest_value' ORDER BY q.position NULLS LAST, q.label), '{}'::json)
+                FROM quantities q WHERE q.cute_name = i.cute_name)
+        FROM instruments i
+        LEFT JOIN general_settings gs ON gs.cute_name = i.cute_name
+        LEFT JOIN model_and_options mo ON mo.cute_name = i.cute_name
+        LEFT JOIN visa v ON v.cute_name = i.cute_name
+        WHERE i.cute_name = %s;"""
+
+    with connection.cursor() as cursor:
+        cursor.execute(query, (instrument_name,))
+        result = cursor.fetchone()
+
+    if result is None:
+        raise ValueError(f"Instrument '{instrument_name}' does not exist.")
+
+    instrument_interface, general_settings, model_options, visa_settings, quantities = result
+    return {'instrument_interface': instrument_interface, 'general_settings': general_settings,
+            'model_and_options': model_options, 'visa': visa_settings, 'quantities': quantities}
+
+
 def getLatestValue(connection: object, instrument_name: str, label: str) -> str:
     table = 'quantities'
     latest_value = None
     with connection.cursor() as cursor:
-        latest_value_query = "SELECT {column} FROM {table_name} WHERE cute_name = '{cute_name}' and label = '{label}';"\
-            .format(column='latest_value', table_name=table, cute_name=instrument_name, label=label)
-        cursor.execute(latest_value_query)
-        latest_value = cursor.fetchone()[0]
+        latest_value_query = "SELECT latest_value FROM %s WHERE cute_name = %s and label = %s;"
+        cursor.execute(latest_value_query, (AsIs(table), instrument_name, label))
+        row = cursor.fetchone()
+        if row:
+            latest_value = row[0]
 
     return latest_value
 
 
+def getLatestValues(connection: object, quantities: list) -> dict:
+    """Returns latest value of many quantities with a single SELECT
+        quantities -- list of (cute_name, label)
+        Returns dictionary with key: (cute_name, label), value: latest value
+    """
+    if not quantities:
+        return {}
+
+    with connection.cursor() as cursor:
+        query = "SELECT cute_name, label, latest_value FROM quantities WHERE (cute_name, label) IN %s;"
+        cursor.execute(query, (tuple((cute_name, label) for cute_name, label in quantities),))
+        return {(cute_name, label): latest_value for cute_name, label, latest_value in cursor.fetchall()}
+
+
 def setLatestValue(connection: object, latest_value: str, instrument_name: str, label: str):
     table = 'quantities'
     with connection.cursor() as cursor:
@@ -263,6 +320,21 @@ def setLatestValue(connection: object, latest_value: str, instrument_name: str,
         cursor.execute(query)
         connection.commit()
 
+def setLatestValues(connection: object, latest_values: dict):
+    """Sets latest value of many quantities with a single multi-row UPDATE. Does not commit.
+        latest_values -- dictionary with key: (cute_name, label), value: latest value
+    """
+    if not latest_values:
+        return
+
+    rows = [(cute_name, label, None if value is None else str(value))
+            for (cute_name, label), value in latest_values.items()]
+    with connection.cursor() as cursor:
+        query = "UPDATE quantities AS q SET latest_value = v.latest_value " \
+                "FROM (VALUES %s) AS v(cute_name, label, latest_value) " \
+                "WHERE q.cute_name = v.cute_name AND q.label = v.label;"
+        execute_values(cursor, query, rows, template='(%s, %s, %s::TEXT)', page_size=len(rows))
+
 def deleteInstrument(connection: object, cute_name: str):
     table_names = ['general_settings', 'model_and_options', 'visa', 'quantities', 'instruments']
     with connection.cursor() as cursor:
@@ -1,9 +1,11 @@
+import copy
 import pyvisa
-import requests
 import logging
 from enum import Enum
 from http import HTTPStatus
 from Instrument.instrument_manager import InstrumentManager
+from Instrument.latest_value_store import get_latest_value_store
+from Instrument.instrument_server_client import get_instrument_server_client
 import sys
 import importlib
 import os
@@ -25,6 +27,8 @@ class AlreadyConnectedError(Exception):
 class InstrumentConnectionService:
     def __init__(self, logger: logging.Logger) -> None:
         self._connected_instruments = {}
+        # key: cute_name, value: (ETag, driver) of the last driver received from the Instrument Server
+        self._drivers = {}
         self._my_logger = logger
         self._my_logger.debug(f'{self.__class__.__name__} initialized...')
 
@@ -35,21 +39,37 @@ class InstrumentConnectionService:
     def is_connected(self, cute_name: str) -> bool:
         return cute_name in self._connected_instruments.keys()
 
-    def connect_to_visa_instrument(self, cute_name: str):
-        """Creates and stores connection to given VISA instrument"""
+    def get_driver(self, cute_name: str) -> dict:
+        """Returns the driver of the instrument. The server only sends it again if it changed since the last call"""
+        headers = {}
+        if cute_name in self._drivers:
+            headers['If-None-Match'] = f'"{self._drivers[cute_name][0]}"'
 
-        if self.is_connected(cute_name):
-            raise AlreadyConnectedError(f'{cute_name} is already connected.')
+        response = get_instrument_server_client().get('/instrumentDB/getInstrument', params={'cute_name': cute_name},
+                                                      headers=headers)
 
-        # Use cute_name to determine the interface (hit endpoint for that)
-        url = r'http://127.0.0.1:5000/instrumentDB/getInstrument'
-        response = requests.get(url, params={'cute_name': cute_name})
+        if response.status_code == HTTPStatus.NOT_MODIFIED:
+            self._my_logger.debug(f'Driver of {cute_name} did not change, using cached copy')
+            return copy.deepcopy(self._drivers[cute_name][1])
 
         # raise exception for error
-        if HTTPStatus.OK < response.status_code >= HTTPStatus.MULTIPLE_CHOICES:
+        if response.status_code >= HTTPStatus.MULTIPLE_CHOICES:
             response.raise_for_status()
 
         driver_dict = dict(response.json())
+        etag = response.headers.get('ETag')
+        if etag:
+            self._drivers[cute_name] = (etag.strip('"'), copy.deepcopy(driver_dict))
+        return driver_dict
+
+    def connect_to_visa_instrument(self, cute_name: str):
+        """Creates and stores connection to given VISA instrument"""
+
+        if self.is_connected(cute_name):
+            raise AlreadyConnectedError(f'{cute_name} is already connected.')
+
+        # Use cute_name to determine the interface (hit endpoint for that)
+        driver_dict = self.get_driver(cute_name)
         interface = driver_dict['instrument_interface']['interface']
         address = driver_dict['instrument_interface']['address']
 
@@ -124,13 +144,7 @@ class InstrumentConnectionService:
             raise ValueError(f'{cute_name} is already connected.')
 
         # Use cute_name to determine the interface (hit endpoint for that)
-        url = r'http://127.0.0.1:5000/instrumentDB/getInstrument'
-        response = requests.get(url, params={'cute_name': cute_name})
-        # raise exception for error
-        if 200 < response.status_code >= 300:
-            response.raise_for_status()
-
-        response_dict = dict(response.json())
+        response_dict = self.get_driver(cute_name)
         try:
             # importing custom driver module from the driver_path
             driver_path = response_dict["general_settings"]["driver_path"]
@@ -170,6 +184,12 @@ class InstrumentConnectionService:
         del self._connected_instruments[cute_name]
         self._my_logger.debug(f"Disconnected {cute_name}.")
 
+        # make sure the latest values of the instrument reach the database
+        try:
+            get_latest_value_store().flush(cute_name)
+        except Exception as e:
+            self._my_logger.error(f"Could not persist latest values of {cute_name}: {e}")
+
     def disconnect_all_instruments(self):
         instr_names = list(self._connected_instruments.keys())
         list_of_failures = list()
@@ -202,8 +222,7 @@ class InstrumentConnectionService:
         return f'{TCPIP_INTERFACE}::{address}::{END}'
 
     def add_instrument_to_database(self, details: dict):
-        url = r'http://127.0.0.1:5000/instrumentDB/addInstrument'
-        response = requests.post(url, json=details)
+        response = get_instrument_server_client().post('/instrumentDB/addInstrument', json=details)
         if HTTPStatus.MULTIPLE_CHOICES > response.status_code <= HTTPStatus.OK:
             return True, response.json()
         else:
@@ -221,8 +240,8 @@ class InstrumentConnectionService:
         except Exception as e:
             self._my_logger.info(f'Instrument {cute_name} is not currently connected.')
 
-        url = r'http://127.0.0.1:5000/instrumentDB/removeInstrument'
-        response = requests.get(url, params={'cute_name': cute_name})
+        self._drivers.pop(cute_name, None)
+        response = get_instrument_server_client().get('/instrumentDB/removeInstrument', params={'cute_name': cute_name})
         if HTTPStatus.MULTIPLE_CHOICES > response.status_code <= HTTPStatus.OK:
             return "Instrument removed."
         else:
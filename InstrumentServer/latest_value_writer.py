@@ -0,0 +1,151 @@
+import logging
+import threading
+import time
+
+from DB import db
+import instrumentDBService as ids
+
+
+###################################################################################
+# LatestValueWriter
+###################################################################################
+class LatestValueWriter:
+    """Write-behind queue for the latest_value column of the quantities table.
+    Pending updates are coalesced per (cute_name, label), only the last value is kept, and are written
+    by a background thread in one transaction once flush_interval seconds passed or max_batch values are pending.
+    """
+
+    def __init__(self, app, logger: logging.Logger, flush_interval: float = 0.5, max_batch: int = 500):
+        self._app = app
+        self._logger = logger
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+
+        # key: (cute_name, label), value: latest value
+        self._pending = dict()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake_up = threading.Event()
+        self._stopped = False
+
+        # statistics
+        self._coalesced = 0
+        self._flush_count = 0
+        self._flushed_values = 0
+        self._failed_flushes = 0
+        self._last_flush_latency = 0.0
+        self._max_flush_latency = 0.0
+        self._total_flush_latency = 0.0
+
+        self._worker = threading.Thread(target=self._run, name='LatestValueWriter', daemon=True)
+        self._worker.start()
+
+    def put(self, cute_name: str, label: str, latest_value):
+        """Queues the latest value of a quantity"""
+        self.put_many({(cute_name, label): latest_value})
+
+    def put_many(self, latest_values: dict):
+        """Queues many latest values
+        Parameters:
+            latest_values -- dictionary with key: (cute_name, label), value: latest value
+        """
+        with self._lock:
+            for key, value in latest_values.items():
+                if key in self._pending:
+                    self._coalesced += 1
+                self._pending[key] = value
+            queue_depth = len(self._pending)
+
+        if queue_depth >= self.max_batch:
+            self._wake_up.set()
+
+    def get_pending(self, cute_name: str, label: str):
+        """Returns (True, value) if a value of the quantity is waiting to be written, (False, None) otherwise"""
+        with self._lock:
+            if (cute_name, label) in self._pending:
+                return True, self._pending[(cute_name, label)]
+        return False, None
+
+    def discard(self, cute_name: str):
+        """Drops all pending values of an instrument (e.g. when it is removed)"""
+        with self._lock:
+            for key in [key for key in self._pending if key[0] == cute_name]:
+                del self._pending[key]
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._pending)
+
+    @property
+    def stats(self) -> dict:
+        average_latency = self._total_flush_latency / self._flush_count if self._flush_count else 0.0
+        return {'queue_depth': self.queue_depth,
+                'coalesced': self._coalesced,
+                'flush_count': self._flush_count,
+                'flushed_values': self._flushed_values,
+                'failed_flushes': self._failed_flushes,
+                'last_flush_latency_ms': self._last_flush_latency * 1000.0,
+                'max_flush_latency_ms': self._max_flush_latency * 1000.0,
+                'avg_flush_latency_ms': average_latency * 1000.0}
+
+    def flush(self):
+        """Writes all pending values in one transaction"""
+        with self._flush_lock:
+            with self._lock:
+                latest_values = self._pending
+                self._pending = dict()
+
+            if not latest_values:
+                return
+
+            start = time.perf_counter()
+            written = False
+            try:
+                with self._app.app_context():
+                    connection = db.get_db()
+                    try:
+                        ids.setLatestValues(connection, latest_values)
+                        connection.commit()
+                        written = True
+                    finally:
+                        # the pool rolls back a failed transaction, the connection must not be used after this
+                        db.close_db(connection)
+            except Exception:
+                self._failed_flushes += 1
+                raise
+            finally:
+                if not written:
+                    # retry on the next flush unless a newer value arrived in the meantime
+                    with self._lock:
+                        for key, value in latest_values.items():
+                            self._pending.setdefault(key, value)
+
+            latency = time.perf_counter() - start
+            self._flush_count += 1
+            self._flushed_values += len(latest_values)
+            self._last_flush_latency = latency
+            self._max_flush_latency = max(self._max_flush_latency, latency)
+            self._total_flush_latency += latency
+
+            if self.queue_depth >= self.max_batch:
+                self._logger.warning(f'Latest value writer is falling behind: {self.queue_depth} values pending '
+                                     f'after writing {len(latest_values)} in {latency * 1000.0:.1f} ms')
+
+    def stop(self):
+        """Stops the background thread after writing all pending values"""
+        self._stopped = True
+        self._wake_up.set()
+        self._worker.join(timeout=self.flush_interval + 5.0)
+        self.flush()
+
+    def _run(self):
+        while not self._stopped:
+            self._wake_up.wait(self.flush_interval)
+            self._wake_up.clear()
+            if self._stopped:
+                break
+
+            try:
+                self.flush()
+            except Exception as e:
+                self._logger.error(f'Could not write {self.queue_depth} latest value(s): {e}')
@@ -8,6 +8,7 @@ import datetime
 from http import HTTPStatus
 
 from flask import (Blueprint, jsonify)
+from DB import db
 
 '''
 Create 'serverStatus' Blueprint
@@ -42,3 +43,9 @@ def get_Os_Platform():
 def get_server_utc_time():
     my_logger.debug("/getServerUTCTime was hit!")
     return jsonify(datetime.datetime.utcnow()), HTTPStatus.OK
+
+
+@bp.route('/dbPoolStats')
+def get_db_pool_stats():
+    my_logger.debug("/dbPoolStats was hit!")
+    return jsonify(db.get_pool_stats()), HTTPStatus.OK
@@ -1,76 +1,71 @@
 #!/usr/bin/env python
 
+import hashlib
 from Instrument.instrument_manager import InstrumentManager
+from Instrument.latest_value_store import get_latest_value_store
 import numpy as np
 
 
 class Agilent33220AManager(InstrumentManager):
-    """ This class implements the Agilen 33250 AWG"""
-    
-    def write(self, msg):
+    """ This class implements the Agilent 33220A AWG"""
+
+    # the arbitrary waveform DAC is 14 bit, :DATA:DAC takes codes from -8191 to +8191
+    DAC_MAX_CODE = 8191
+
+    def __init__(self, name, connection, driver, logger):
+        # sha1 of the int16 waveform currently in volatile memory, so an unchanged waveform is not sent again
+        self._loaded_waveform_hash = None
+        super().__init__(name, connection, driver, logger)
+
+    def _write(self, msg):
         if msg:
             self._logger.critical("Calling from the driver class.")
             self._instrument.write(msg)
 
+    def invalidate_cached_state(self):
+        # *RST, *RCL and clear() may have changed the volatile memory, the next waveform is sent again
+        self._loaded_waveform_hash = None
+        super().invalidate_cached_state()
+
     def set_value(self, quantity, value):
-        # keep track of if waveform is updated, to avoid sending it many times
+        # the waveform is uploaded as binary block, only if it differs from the one already loaded
         if quantity in ('Arb. Waveform',):
-            pass
+            self.send_waveform(value)
         else:
             # for all other cases, call VISA driver
             super().set_value(quantity, value)
 
-    # def performOpen(self, options={}):
-    #     """Perform the operation of opening the instrument connection"""
-    #     # add compatibility with pre-python 3 version of Labber
-    #     if not hasattr(self, 'write_raw'):
-    #         self.write_raw = self.write
-    #     # start by calling the generic VISA open to make sure we have a connection
-    #     super.performOpen(self, options)
-    #     # clear value of waveform
-    #     self.setValue('Arb. Waveform', [])
-
-    # def set_value(self, quant, value, sweepRate=0.0, options={}):
-    #     """Perform the Set Value instrument operation. This function should
-    #     return the actual value set by the instrument"""
-    #     # keep track of if waveform is updated, to avoid sending it many times
-    #     if self.isFirstCall(options):
-    #         self.bWaveUpdated = False
-    #     if quant in ('Arb. Waveform',):
-    #         # set value, then mark that waveform needs an update
-    #         quant.set_value(value)
-    #         self.bWaveUpdated = True
-    #     else:
-    #         # for all other cases, call VISA driver
-    #         value = super.set_value(quant, value)
-    #     # if final call and wave is updated, send it to AWG
-    #     if self.isFinalCall(options) and self.bWaveUpdated:
-    #         self.sendWaveform()
-    #     return value
+    def send_waveform(self, vData):
+        """Rescales the waveform to I16 and sends it to volatile memory, unless the same data is loaded already"""
+        vData = np.asarray(vData, dtype=np.float64)
+        # get range and scale to I16
+        Vpp = self.quantities['Voltage'].get_latest_value()
+        Vpp = float(Vpp) if Vpp is not None else float(self.get_value('Voltage'))
+        vI16 = self.scaleWaveformToI16(vData, Vpp)
 
+        # the instrument is initialized with :FORM:BORD SWAP, send least significant byte first
+        data = vI16.astype('<i2', copy=False).tobytes()
+        waveform_hash = hashlib.sha1(data).hexdigest()
+        if waveform_hash != self._loaded_waveform_hash:
+            # create data as bytes with definite length block header
+            sLen = b'%d' % len(data)
+            sHead = b':DATA:DAC VOLATILE, #%d%s' % (len(sLen), sLen)
+            # mark as unknown while transferring, a failed upload leaves the volatile memory undefined
+            self._loaded_waveform_hash = None
+            self.write_raw(sHead + data)
+            self._loaded_waveform_hash = waveform_hash
+        else:
+            self._logger.debug(f"Waveform of '{self.name}' is already loaded, not sending it again.")
 
-    # def sendWaveform(self):
-    #     """Rescale and send waveform data to the Tek"""
-    #     # get data
-    #     vData = self.getValueArray('Arb. Waveform')
-    #     # get range and scale to U16
-    #     Vpp = self.getValue('Voltage')
-    #     vI16 = self.scaleWaveformToI16(vData, Vpp)
-    #     length = len(vI16)
-    #     # create data as bytes with header
-    #     sLen = b'%d' % (2*length)
-    #     sHead = b':DATA:DAC VOLATILE, #%d%s' % (len(sLen), sLen)
-    #     # write header + data
-    #     self.write_raw(sHead + vI16.tobytes())
-    #     # select volatile waveform
-    #     self.write(':FUNC:USER VOLATILE')
+        # select volatile waveform
+        self.write(':FUNC:USER VOLATILE')
+        # traces are kept in memory only, like vectors that are read
+        get_latest_value_store().set(self.name, 'Arb. Waveform', vData, persist=False)
 
-        
     def scaleWaveformToI16(self, vData, dVpp):
-        """Scales the waveform and returns data in a string of I16"""
-        # clip waveform and store in-place
-        np.clip(vData, -dVpp/2., dVpp/2., vData)
-        vI16 = np.array(2047 * vData / (dVpp/2.), dtype=np.int16)
+        """Scales the waveform and returns data as array of I16. vData is not modified"""
+        vData = np.clip(np.asarray(vData, dtype=np.float64), -dVpp/2., dVpp/2.)
+        vI16 = (self.DAC_MAX_CODE * vData / (dVpp/2.)).astype(np.int16)
         return vI16
 
 
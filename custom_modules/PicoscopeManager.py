@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 from picoscope import *
 from Instrument.instrument_manager import InstrumentManager
+from Instrument.latest_value_store import fetch_latest_values, persist_latest_values
 import numpy as np
 import time
 import matplotlib.pyplot as plt
@@ -21,29 +22,29 @@ class PicoscopeManager(InstrumentManager):
         return ps
 
     def get_value(self, quantity):
-        url = r'http://localhost:5000/instrumentDB/getLatestValue'
-        response = requests.get(url, params={'cute_name': self._name, 'label': quantity})
-        if 300 > response.status_code <= 200:
-            # success
-            pass
-        else:
-            response.raise_for_status()
-
-        value = response.json()
-        if value['latest_value'] is None:
-            return self.quantities[quantity]['def_value']
-        else:
-            return value['latest_value']
+        return self.get_values([quantity])[quantity]
+
+    def get_values(self, quantities: list) -> dict:
+        """Returns the latest value of many quantities with a single request to the Instrument Server"""
+        latest_values = fetch_latest_values([(self._name, quantity) for quantity in quantities])
+
+        values = {}
+        for quantity in quantities:
+            value = latest_values.get((self._name, quantity))
+            if value is None:
+                values[quantity] = self._driver['quantities'][quantity]['def_value']
+            else:
+                values[quantity] = value
+        return values
 
     def set_value(self, quantity, value):
-        self._check_limits(quantity, value)
-        url = r'http://localhost:5000/instrumentDB/setLatestValue'
-        response = requests.put(url, params={'cute_name': self._name, 'label': quantity, 'latest_value': value})
-        if 300 > response.status_code <= 200:
-            # success
-            pass
-        else:
-            response.raise_for_status()
+        self.set_values({quantity: value})
+
+    def set_values(self, values: dict):
+        """Sets many quantities with a single request to the Instrument Server"""
+        for quantity, value in values.items():
+            self._check_limits(quantity, value)
+        persist_latest_values({(self._name, quantity): value for quantity, value in values.items()})
 
     '''Closes Picoscope. Should be called when done using NonVisaInstrumentManager'''
 
@@ -54,10 +55,11 @@ class PicoscopeManager(InstrumentManager):
         self.close()
 
     def _signal_generator(self):
-        frequency = float(self.get_value('Frequency'))
-        offset_voltage = float(self.get_value('Offset'))
-        pk_to_pk = float(self.get_value('Amplitude'))
-        wave_type = self.get_value('Wave Type')
+        values = self.get_values(['Frequency', 'Offset', 'Amplitude', 'Wave Type'])
+        frequency = float(values['Frequency'])
+        offset_voltage = float(values['Offset'])
+        pk_to_pk = float(values['Amplitude'])
+        wave_type = values['Wave Type']
 
         waveform_desired_duration = 1 / frequency
         obs_duration = 10 * waveform_desired_duration
@@ -0,0 +1,148 @@
+import logging
+import os
+import sys
+import unittest
+from unittest import mock
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from Instrument.instrument_manager import InstrumentManager, _join_commands
+
+
+class FakeResource:
+    """Stands in for a pyvisa message based resource, answers queries from a list of canned replies"""
+
+    def __init__(self, replies=None):
+        self.write_termination = '\n'
+        self.written = []
+        self.replies = list(replies or [])
+        self.clears = 0
+
+    def write(self, message):
+        self.written.append(message)
+
+    def read(self):
+        return self.replies.pop(0)
+
+    def clear(self):
+        self.clears += 1
+
+    def close(self):
+        pass
+
+
+def create_instrument_manager(resource: FakeResource, coalesce_commands=True, max_message_length=None):
+    driver = {'instrument_interface': {'serial': False},
+              'model_and_options': {'model_cmd': '*IDN?', 'models': ['33220A']},
+              'visa': {'timeout': 1.0, 'term_char': 'LF', 'send_end_on_write': True, 'query_instr_errors': False,
+                       'str_true': '1', 'str_false': '0', 'init': None, 'final': None,
+                       'coalesce_commands': coalesce_commands, 'max_message_length': max_message_length},
+              'quantities': {}}
+    resource.replies.insert(0, 'Agilent Technologies,33220A,0,2.02')
+
+    resource_manager = mock.Mock()
+    resource_manager.open_resource.return_value = resource
+    with mock.patch('Instrument.instrument_manager.ResourceManager', return_value=resource_manager), \
+            mock.patch.object(InstrumentManager, 'refresh_latest_values'):
+        instrument_manager = InstrumentManager('AWG', 'GPIB0::10::INSTR', driver, logging.getLogger(__name__))
+
+    resource.written.clear()
+    return instrument_manager
+
+
+class JoinCommandsTest(unittest.TestCase):
+
+    def test_commands_are_resolved_from_the_root(self):
+        self.assertEqual(_join_commands(['FREQ 1000', 'VOLT 0.5'], 256), [('FREQ 1000;:VOLT 0.5', 2)])
+
+    def test_common_and_rooted_commands_are_not_prefixed(self):
+        self.assertEqual(_join_commands(['FREQ 1000', '*OPC', ':VOLT 0.5'], 256), [('FREQ 1000;*OPC;:VOLT 0.5', 3)])
+
+    def test_empty_commands_are_skipped(self):
+        self.assertEqual(_join_commands(['', 'FREQ 1000', '  ', 'VOLT 0.5 '], 256), [('FREQ 1000;:VOLT 0.5', 2)])
+        self.assertEqual(_join_commands(['', ' '], 256), [])
+
+    def test_messages_do_not_exceed_the_maximum_length(self):
+        messages = _join_commands(['FREQ 1000', 'VOLT 0.5', 'OUTP ON'], 20)
+
+        self.assertEqual(messages, [('FREQ 1000;:VOLT 0.5', 2), ('OUTP ON', 1)])
+        self.assertTrue(all(len(message) <= 20 for message, _ in messages))
+
+    def test_long_command_is_sent_on_its_own(self):
+        long_command = 'DATA:DAC VOLATILE,' + ','.join(['0'] * 20)
+
+        self.assertEqual(_join_commands(['FREQ 1000', long_command, 'VOLT 0.5'], 20),
+                         [('FREQ 1000', 1), (long_command, 1), ('VOLT 0.5', 1)])
+
+
+class BatchTest(unittest.TestCase):
+
+    def test_batch_joins_writes(self):
+        resource = FakeResource()
+        instrument_manager = create_instrument_manager(resource)
+
+        with instrument_manager.batch():
+            instrument_manager.write('FREQ 1000')
+            instrument_manager.write('VOLT 0.5')
+            self.assertEqual(resource.written, [])
+
+        self.assertEqual(resource.written, ['FREQ 1000;:VOLT 0.5'])
+        instrument_manager.close()
+
+    def test_termination_counts_against_the_message_length(self):
+        resource = FakeResource()
+        # 'FREQ 1000;:VOLT 0.5' has 19 characters, 20 with the '\n' appended by pyvisa
+        instrument_manager = create_instrument_manager(resource, max_message_length=19)
+
+        with instrument_manager.batch():
+            instrument_manager.write('FREQ 1000')
+            instrument_manager.write('VOLT 0.5')
+
+        self.assertEqual(resource.written, ['FREQ 1000', 'VOLT 0.5'])
+        instrument_manager.close()
+
+
+class AskManyTest(unittest.TestCase):
+
+    def test_replies_are_split_per_command(self):
+        resource = FakeResource(['1000;0.5'])
+        instrument_manager = create_instrument_manager(resource)
+
+        self.assertEqual(instrument_manager.ask_many(['FREQ?', 'VOLT?']), ['1000', '0.5'])
+        self.assertEqual(resource.written, ['FREQ?;:VOLT?'])
+        instrument_manager.close()
+
+    def test_single_query_reply_is_not_split(self):
+        resource = FakeResource(['"a;b"'])
+        instrument_manager = create_instrument_manager(resource)
+
+        self.assertEqual(instrument_manager.ask_many(['DISP:TEXT?']), ['"a;b"'])
+        instrument_manager.close()
+
+    def test_unexpected_reply_falls_back_permanently(self):
+        # the instrument answers only the first query of the compound query
+        resource = FakeResource(['1000', '1000', '0.5', '2000', '0.7'])
+        instrument_manager = create_instrument_manager(resource)
+
+        self.assertEqual(instrument_manager.ask_many(['FREQ?', 'VOLT?']), ['1000', '0.5'])
+        self.assertEqual(resource.written, ['FREQ?;:VOLT?', 'FREQ?', 'VOLT?'])
+        self.assertEqual(resource.clears, 1)
+
+        # later calls do not try the compound query again
+        resource.written.clear()
+        self.assertEqual(instrument_manager.ask_many(['FREQ?', 'VOLT?']), ['2000', '0.7'])
+        self.assertEqual(resource.written, ['FREQ?', 'VOLT?'])
+        instrument_manager.close()
+
+    def test_driver_can_opt_out(self):
+        resource = FakeResource(['1000', '0.5'])
+        instrument_manager = create_instrument_manager(resource, coalesce_commands=False)
+
+        self.assertEqual(instrument_manager.ask_many(['FREQ?', 'VOLT?']), ['1000', '0.5'])
+        self.assertEqual(resource.written, ['FREQ?', 'VOLT?'])
+        instrument_manager.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
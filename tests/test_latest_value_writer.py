@@ -0,0 +1,99 @@
+import logging
+import os
+import sys
+import unittest
+from unittest import mock
+
+from flask import Flask
+
+# the Instrument Server modules import each other by module name, as when started by InstrumentServer/__init__.py
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'InstrumentServer'))
+sys.path.insert(0, ROOT_DIR)
+
+from DB import db
+import instrumentDBService as ids
+from latest_value_writer import LatestValueWriter
+
+
+class FakeConnection:
+    def __init__(self):
+        self.commits = 0
+
+    def commit(self):
+        self.commits += 1
+
+
+class FakePool:
+    """Stands in for DB.db.ConnectionPool, records which connections were returned"""
+
+    def __init__(self):
+        self.in_use = set()
+        self.returned = []
+
+    def getconn(self):
+        connection = FakeConnection()
+        self.in_use.add(connection)
+        return connection
+
+    def putconn(self, connection):
+        self.in_use.remove(connection)
+        self.returned.append(connection)
+
+
+class LatestValueWriterFlushTest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.pool = FakePool()
+        self.app.extensions['db_pool'] = self.pool
+        self.app.teardown_appcontext(db.teardown_db)
+        # flushes are only triggered by the test
+        self.writer = LatestValueWriter(self.app, logging.getLogger(__name__), flush_interval=3600.0)
+
+    def tearDown(self):
+        with mock.patch.object(ids, 'setLatestValues'):
+            self.writer.stop()
+
+    def test_flush_writes_pending_values(self):
+        self.writer.put_many({('DMM', 'Voltage'): '1.0', ('DMM', 'Range'): '10'})
+
+        with mock.patch.object(ids, 'setLatestValues') as set_latest_values:
+            self.writer.flush()
+
+        set_latest_values.assert_called_once()
+        self.assertEqual(set_latest_values.call_args[0][1], {('DMM', 'Voltage'): '1.0', ('DMM', 'Range'): '10'})
+        self.assertEqual(self.writer.queue_depth, 0)
+        self.assertEqual(self.pool.returned[0].commits, 1)
+        self.assertFalse(self.pool.in_use)
+
+    def test_failed_flush_requeues_values(self):
+        self.writer.put_many({('DMM', 'Voltage'): '1.0', ('DMM', 'Range'): '10'})
+
+        with mock.patch.object(ids, 'setLatestValues', side_effect=ValueError('write failed')):
+            with self.assertRaises(ValueError):
+                self.writer.flush()
+
+        self.assertEqual(self.writer.queue_depth, 2)
+        self.assertEqual(self.writer.stats['failed_flushes'], 1)
+        # the connection went back to the pool once, without a commit
+        self.assertEqual(len(self.pool.returned), 1)
+        self.assertEqual(self.pool.returned[0].commits, 0)
+        self.assertFalse(self.pool.in_use)
+
+    def test_failed_flush_keeps_newer_values(self):
+        self.writer.put('DMM', 'Voltage', '1.0')
+
+        def fail(connection, latest_values):
+            self.writer.put('DMM', 'Voltage', '2.0')
+            raise ValueError('write failed')
+
+        with mock.patch.object(ids, 'setLatestValues', side_effect=fail):
+            with self.assertRaises(ValueError):
+                self.writer.flush()
+
+        self.assertEqual(self.writer.get_pending('DMM', 'Voltage'), (True, '2.0'))
+
+
+if __name__ == '__main__':
+    unittest.main()
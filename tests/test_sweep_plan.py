@@ -0,0 +1,84 @@
+import os
+import sys
+import unittest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from GUI.sweep_plan import SweepPlan
+
+
+class SweepPlanTest(unittest.TestCase):
+
+    def test_linear_order(self):
+        plan = SweepPlan([[[1, 2]], [[10, 20, 30]]])
+
+        self.assertEqual(len(plan), 6)
+        self.assertEqual([step.values for step in plan],
+                         [((1,), (10,)), ((1,), (20,)), ((1,), (30,)),
+                          ((2,), (10,)), ((2,), (20,)), ((2,), (30,))])
+
+    def test_changed_levels(self):
+        plan = SweepPlan([[[1, 2]], [[10, 20, 30]]])
+
+        # every level is set on the first step, the outer level only when it moves to its next point
+        self.assertEqual([step.changed_levels for step in plan],
+                         [(0, 1), (1,), (1,), (0, 1), (1,), (1,)])
+
+    def test_quantities_of_a_level_step_together(self):
+        plan = SweepPlan([[[1, 2], ['a', 'b']]])
+
+        self.assertEqual([step.values for step in plan], [((1, 'a'),), ((2, 'b'),)])
+
+    def test_number_of_sets(self):
+        # outer level: 2 quantities set twice, inner level: 1 quantity set on all 6 steps
+        plan = SweepPlan([[[1, 2], ['a', 'b']], [[10, 20, 30]]])
+
+        self.assertEqual(plan.number_of_sets, 2 * 2 + 6)
+
+    def test_single_point_level_is_set_once(self):
+        plan = SweepPlan([[[5]], [[10, 20]]])
+
+        self.assertEqual([step.changed_levels for step in plan], [(0, 1), (1,)])
+        self.assertEqual(plan.number_of_sets, 3)
+
+    def test_no_levels(self):
+        plan = SweepPlan([])
+
+        steps = list(plan)
+        self.assertEqual(len(steps), 1)
+        self.assertEqual(steps[0].values, ())
+        self.assertEqual(steps[0].changed_levels, ())
+        self.assertEqual(plan.number_of_sets, 0)
+
+    def test_snake_order(self):
+        plan = SweepPlan([[[0, 1]], [[0, 1, 2]], [[0, 1]]], snake=True)
+
+        self.assertEqual([tuple(value for value, in step.values) for step in plan],
+                         [(0, 0, 0), (0, 0, 1), (0, 1, 1), (0, 1, 0), (0, 2, 0), (0, 2, 1),
+                          (1, 2, 1), (1, 2, 0), (1, 1, 0), (1, 1, 1), (1, 0, 1), (1, 0, 0)])
+
+    def test_snake_changes_one_level_per_step(self):
+        plan = SweepPlan([[[0, 1]], [[0, 1, 2]], [[0, 1]]], snake=True)
+        steps = list(plan)
+
+        self.assertEqual(steps[0].changed_levels, (0, 1, 2))
+        self.assertTrue(all(len(step.changed_levels) == 1 for step in steps[1:]))
+        # every point is visited exactly once
+        self.assertEqual(len({step.values for step in steps}), 12)
+        # the linear order sets the inner level on all 12 steps and the middle one on 6
+        self.assertEqual(plan.number_of_sets, 3 + 11)
+        self.assertEqual(SweepPlan([[[0, 1]], [[0, 1, 2]], [[0, 1]]]).number_of_sets, 2 + 6 + 12)
+
+    def test_inner_pass(self):
+        plan = SweepPlan([[[0, 1]], [[10, 20, 30]]], snake=True)
+
+        self.assertEqual(plan.inner_pass(0), [(10,), (20,), (30,)])
+        self.assertEqual(plan.inner_pass(2), [(10,), (20,), (30,)])
+        # the second pass runs backwards
+        self.assertEqual(plan.inner_pass(3), [(30,), (20,), (10,)])
+        self.assertEqual(plan.inner_pass(5), [(30,), (20,), (10,)])
+
+
+if __name__ == '__main__':
+    unittest.main()